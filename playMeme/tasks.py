@@ -1,8 +1,136 @@
-from time import sleep
+import logging
+import smtplib
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+from templated_mail.mail import BaseEmailMessage
+from store.models import Customer
 
-@shared_task
-def notify_customers(mess, *args, **kwargs):
-    print('Starting sending...')
-    sleep(5)
-    print('Mail sending completed!')
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+PROGRESS_KEY = 'playMeme:notify:{run_id}'
+PROGRESS_TIMEOUT = 7 * 24 * 60 * 60
+
+AUDIENCE_CUSTOMERS = 'customers'
+AUDIENCE_BUYERS = 'buyers'
+
+
+def get_recipients(audience):
+    """(customer id, email) of the audience, in customer id order."""
+    customers = Customer.objects.exclude(user__email='')
+    if audience == AUDIENCE_BUYERS:
+        # denormalized from the orders, no join needed
+        customers = customers.filter(orders_count__gt=0)
+    elif audience != AUDIENCE_CUSTOMERS:
+        raise ValueError(f'Unknown audience {audience!r}')
+    return customers.order_by('id').values_list('id', 'user__email')
+
+
+def render(template_name, context=None):
+    """Render the subject and bodies of a templated mail, they are the same for every recipient."""
+    email = BaseEmailMessage(template_name=template_name, context=context)
+    email.render()
+    return {'subject': email.subject, 'body': email.body, 'html': email.html}
+
+
+def make_message(rendered, to, connection):
+    message = EmailMultiAlternatives(
+        subject=rendered['subject'],
+        body=rendered['body'] or rendered['html'],
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to],
+        connection=connection
+    )
+    if rendered['body'] and rendered['html']:
+        message.attach_alternative(rendered['html'], 'text/html')
+    elif rendered['html']:
+        message.content_subtype = 'html'
+    return message
+
+
+def send_batch(rendered, audience, after_id=0, batch_size=None):
+    """
+    Send the rendered mail to the next `batch_size` recipients after customer `after_id`,
+    over a single connection. Returns (last id, sent, failed, error): `last id` is the last
+    customer handled, None once the audience is exhausted, and `error` the connection error
+    that stopped the batch early, if any; the batch goes on after `last id` either way.
+    """
+    batch_size = batch_size or settings.PLAYMEME_NOTIFY_BATCH_SIZE
+    recipients = list(get_recipients(audience).filter(id__gt=after_id)[:batch_size])
+    if not recipients:
+        return None, 0, 0, None
+
+    sent = failed = 0
+    last_id = after_id
+    try:
+        with get_connection() as connection:
+            for customer_id, email in recipients:
+                try:
+                    sent += make_message(rendered, email, connection).send()
+                except smtplib.SMTPRecipientsRefused:
+                    # the address is refused, the connection is still usable
+                    failed += 1
+                    logger.warning('Notification to customer %d refused', customer_id)
+                last_id = customer_id
+    except (smtplib.SMTPException, OSError) as error:
+        logger.warning('Notification batch stopped after customer %d: %r', last_id, error)
+        return last_id, sent, failed, error
+    if len(recipients) < batch_size:
+        last_id = None
+    return last_id, sent, failed, None
+
+
+def get_progress(run_id):
+    return cache.get(PROGRESS_KEY.format(run_id=run_id))
+
+
+def record_progress(run_id, sent, failed, last_id):
+    key = PROGRESS_KEY.format(run_id=run_id)
+    progress = cache.get(key) or {'sent': 0, 'failed': 0, 'started_at': timezone.now().isoformat()}
+    progress.update(
+        sent=progress['sent'] + sent,
+        failed=progress['failed'] + failed,
+        last_id=last_id,
+        done=last_id is None
+    )
+    cache.set(key, progress, timeout=PROGRESS_TIMEOUT)
+    return progress
+
+
+@shared_task(bind=True, max_retries=5)
+def notify_customers(self, template_name, context=None, audience=AUDIENCE_CUSTOMERS,
+                     after_id=0, rendered=None, run_id=None, batch_size=None):
+    """
+    Mail `template_name` to every customer of `audience`, one batch per run. The next batch
+    is enqueued with a countdown that keeps the rate under PLAYMEME_NOTIFY_RATE mails per
+    second, so a worker is never blocked waiting. A connection error retries the batch from
+    the last customer handled, with backoff. Progress is kept in the cache under the id of
+    the first run (see `get_progress`).
+    """
+    rendered = rendered or render(template_name, context)
+    run_id = run_id or self.request.id
+    batch_size = batch_size or settings.PLAYMEME_NOTIFY_BATCH_SIZE
+
+    def next_kwargs(after_id):
+        return {
+            'template_name': template_name,
+            'audience': audience,
+            'after_id': after_id,
+            'rendered': rendered,
+            'run_id': run_id,
+            'batch_size': batch_size,
+        }
+
+    last_id, sent, failed, error = send_batch(rendered, audience, after_id, batch_size)
+    progress = record_progress(run_id, sent, failed, last_id)
+    logger.info('Notification %s: %d sent, %d failed so far', run_id, progress['sent'], progress['failed'])
+
+    if error is not None:
+        # from the last customer handled, nobody gets the mail twice
+        raise self.retry(args=(), kwargs=next_kwargs(last_id), exc=error, countdown=2 ** self.request.retries * 60)
+    if last_id is not None:
+        self.apply_async(kwargs=next_kwargs(last_id), countdown=batch_size / settings.PLAYMEME_NOTIFY_RATE)
+    return progress
@@ -1,3 +1,88 @@
-from django.test import TestCase
+import smtplib
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from model_bakery import baker
+from store.models import Order
+from store_core.models import User
+from . import tasks
 
-# Create your tests here.
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Locmem backend whose connection drops after `budget` messages."""
+    budget = None
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.budget is not None:
+            if FlakyEmailBackend.budget == 0:
+                FlakyEmailBackend.budget = None
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            FlakyEmailBackend.budget -= 1
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class NotifyCustomersTests(TestCase):
+    def setUp(self):
+        self.customers = [
+            User.objects.create_user(username=f'user{index}', email=f'user{index}@example.com').customer
+            for index in range(5)
+        ]
+
+    def test_batches_share_one_rendering_and_connection(self):
+        rendered = tasks.render('emails/email.html', {'name': 'Ann'})
+
+        last_id, sent, failed, error = tasks.send_batch(rendered, tasks.AUDIENCE_CUSTOMERS, batch_size=3)
+
+        self.assertEqual((last_id, sent, failed, error), (self.customers[2].id, 3, 0, None))
+        self.assertEqual([message.to for message in mail.outbox], [['user0@example.com'], ['user1@example.com'], ['user2@example.com']])
+        self.assertEqual(len({id(message.connection) for message in mail.outbox}), 1)
+        self.assertEqual(mail.outbox[0].subject, 'This is a long subject')
+        self.assertIn('My name is Ann', mail.outbox[0].body)
+
+        last_id, sent, failed, error = tasks.send_batch(rendered, tasks.AUDIENCE_CUSTOMERS, after_id=last_id, batch_size=3)
+
+        self.assertEqual((last_id, sent, failed, error), (None, 2, 0, None))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_buyers_are_customers_with_orders(self):
+        baker.make(Order, customer=self.customers[1])
+
+        tasks.send_batch(tasks.render('emails/email.html'), tasks.AUDIENCE_BUYERS)
+
+        self.assertEqual([message.to for message in mail.outbox], [['user1@example.com']])
+
+    def test_task_records_progress(self):
+        result = tasks.notify_customers.apply(args=['emails/email.html'], kwargs={'batch_size': 10})
+
+        self.assertEqual(len(mail.outbox), 5)
+        progress = tasks.get_progress(result.id)
+        self.assertEqual((progress['sent'], progress['failed'], progress['done']), (5, 0, True))
+
+    @override_settings(EMAIL_BACKEND='playMeme.tests.FlakyEmailBackend')
+    def test_connection_error_resumes_after_last_recipient(self):
+        FlakyEmailBackend.budget = 2
+        rendered = tasks.render('emails/email.html')
+
+        last_id, sent, failed, error = tasks.send_batch(rendered, tasks.AUDIENCE_CUSTOMERS, batch_size=10)
+
+        self.assertEqual((last_id, sent, failed), (self.customers[1].id, 2, 0))
+        self.assertIsInstance(error, smtplib.SMTPServerDisconnected)
+
+        last_id, sent, failed, error = tasks.send_batch(rendered, tasks.AUDIENCE_CUSTOMERS, after_id=last_id, batch_size=10)
+
+        self.assertEqual((last_id, sent, failed, error), (None, 3, 0, None))
+        self.assertEqual([message.to[0] for message in mail.outbox], [f'user{index}@example.com' for index in range(5)])
+
+    @override_settings(EMAIL_BACKEND='playMeme.tests.FlakyEmailBackend')
+    def test_task_retry_mails_nobody_twice(self):
+        FlakyEmailBackend.budget = 3
+
+        result = tasks.notify_customers.apply(args=['emails/email.html'], kwargs={'batch_size': 10})
+
+        self.assertEqual([message.to[0] for message in mail.outbox], [f'user{index}@example.com' for index in range(5)])
+        progress = tasks.get_progress(result.id)
+        self.assertEqual((progress['sent'], progress['done']), (5, True))
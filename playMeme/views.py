@@ -38,7 +38,7 @@ def say_hello(request):
     #     email.send(to=['nghesinhandan@gmail.cc', 'dumemay@gmail.cc'])
     # except BadHeaderError:
     #     return redirect('store/')
-    notify_customers.delay('Du ma m')
+    notify_customers.delay('emails/email.html', {'name': 'Du ma m'})
     return HttpResponse('nhan danh cong ly du ma may')
 
 @method_decorator(cache_page(1*60), name='get')
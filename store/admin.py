@@ -22,7 +22,7 @@ class CollectionAdmin(admin.ModelAdmin):
     list_per_page = 20
     search_fields = ['title']
 
-    @admin.display(ordering='products_count')
+    @admin.display(ordering='product_count')
     def products_count(self, collection):
         url = (reverse('admin:store_product_changelist')
             + '?'
@@ -30,10 +30,16 @@ class CollectionAdmin(admin.ModelAdmin):
                 {'collection__id': str(collection.id)}
             )
         )
-        return format_html('<a href="{}">{}</a>', url, collection.products_count)
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(products_count=Count('product'))
+        return format_html('<a href="{}">{}</a>', url, collection.product_count)
+
+
+@admin.register(models.TaxRate)
+class TaxRateAdmin(admin.ModelAdmin):
+    list_display = ['region', 'collection', 'rate']
+    list_select_related = ['collection']
+    list_filter = ['region']
+    ordering = ['region', 'collection']
+    autocomplete_fields = ['collection']
 
 
 class InventoryFilter(admin.SimpleListFilter):
@@ -59,6 +65,7 @@ class CustomernAdmin(admin.ModelAdmin):
     list_display = ['id', 'full_name', 'memebership_status', 'orders_count']
     ordering = ['id']
     list_per_page = 20
+    list_select_related = ['user']
     search_fields = ['full_name__istartswith']
     list_filter = ['membership']
     autocomplete_fields = ['user']
@@ -84,9 +91,6 @@ class CustomernAdmin(admin.ModelAdmin):
             ))
         return format_html('<a href="{}">{}</a>', url, customer.orders_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(orders_count=Count('order'))
-
 
 class OrderItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
@@ -101,22 +105,22 @@ class OrderAdmin(admin.ModelAdmin):
     ordering = ['id']
     list_per_page = 20
     exclude = ['placed_at']
+    readonly_fields = ['total_amount', 'item_count']
 
     @admin.display(ordering='customer')
     def customer_fullname(self, order):
         return order.customer
 
-    @admin.display(ordering='orderitems_count')
+    @admin.display(ordering='item_count')
     def orderitems_count(self, order):
-        return order.orderitems_count
+        return order.item_count
 
     @admin.display(ordering='status_of_payment')
     def status_of_payment(self, order):
         return order.status_of_payment
 
     def get_queryset(self, request) :
-        return super().get_queryset(request).annotate(orderitems_count=Count('orderitem')
-            , status_of_payment=F('paymentstatus'))
+        return super().get_queryset(request).annotate(status_of_payment=F('paymentstatus'))
 
 
 class ProductImageInline(admin.TabularInline):
@@ -126,7 +130,10 @@ class ProductImageInline(admin.TabularInline):
 
     def thumbnail(self, instance):
         if instance.image.name != '':
-            return format_html(f'<img src="{instance.image.url}" class="thumbnail"/>')
+            # the full size image until the variants are made
+            name = instance.variants.get('thumbnail')
+            url = instance.image.storage.url(name) if name else instance.image.url
+            return format_html('<img src="{}" class="thumbnail"/>', url)
 
 @admin.register(models.Product)
 class ProductAdmin(admin.ModelAdmin):
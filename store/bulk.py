@@ -0,0 +1,122 @@
+"""
+Bulk product changes: many rows validated like `ProductSerializer` would, then written
+with `bulk_update` / `bulk_create`. Bulk writes don't send model signals, so what the
+Product handlers do per row (cache invalidation, Collection.product_count) is done
+here once per request.
+"""
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+from store import caching
+from store.models import Collection, Product
+from store.serializers import ProductSerializer, TemplatedHyperlinkedRelatedField
+
+
+class PreloadedCollectionField(TemplatedHyperlinkedRelatedField):
+    """Resolves collection urls from `context['collections']` instead of a query per row."""
+    def get_object(self, view_name, view_args, view_kwargs):
+        try:
+            return self.context['collections'][int(view_kwargs[self.lookup_url_kwarg])]
+        except (KeyError, ValueError):
+            raise ObjectDoesNotExist
+
+
+class BulkProductSerializer(ProductSerializer):
+    collection = PreloadedCollectionField(
+        queryset=Collection.objects.all(),
+        view_name='store:collection-detail',
+    )
+
+
+def is_id(value):
+    # JSON true would pass for product 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class BulkChanges:
+    def __init__(self):
+        self.creates = []
+        self.updates = []
+        self.errors = []
+
+
+def validate(rows, context):
+    """
+    Rows with an `id` are partial updates of that product, rows without one create a
+    product. A product may be updated by one row only. Returns a `BulkChanges` whose `errors` lists `{'index', 'errors'}` of the
+    invalid rows.
+    """
+    changes = BulkChanges()
+    context = {**context, 'collections': Collection.objects.in_bulk()}
+    ids = [row['id'] for row in rows if isinstance(row, dict) and is_id(row.get('id'))]
+    products = Product.objects.in_bulk(ids)
+    # in_bulk gives one instance per id, a second row would apply (and count) its changes again
+    seen_ids = set()
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            changes.errors.append({'index': index, 'errors': {'non_field_errors': ['Expected an object']}})
+            continue
+        instance = None
+        if 'id' in row:
+            instance = products.get(row['id']) if is_id(row['id']) else None
+            if instance is None:
+                changes.errors.append({'index': index, 'errors': {'id': ['Product not found']}})
+                continue
+            if instance.pk in seen_ids:
+                changes.errors.append({'index': index, 'errors': {'id': ['Product already updated by another row']}})
+                continue
+            seen_ids.add(instance.pk)
+        serializer = BulkProductSerializer(instance, data=row, partial=instance is not None, context=context)
+        if not serializer.is_valid():
+            changes.errors.append({'index': index, 'errors': serializer.errors})
+        elif instance is None:
+            changes.creates.append(Product(**serializer.validated_data))
+        else:
+            changes.updates.append((instance, serializer.validated_data))
+    return changes
+
+
+def apply(changes, chunk_size=None):
+    """
+    Write valid `changes` in one transaction, in chunks of `chunk_size` rows. The updated
+    products are read again under a row lock and each row writes only the fields it
+    changed, so concurrent writes to other fields (e.g. inventory) are kept. Products
+    deleted since `validate` are skipped.
+    """
+    chunk_size = chunk_size or settings.STORE_BULK_CHUNK_SIZE
+    now = timezone.now()
+    counts = Counter()
+    for instance in changes.creates:
+        instance.last_update = now
+        counts[instance.collection_id] += 1
+
+    with transaction.atomic():
+        ids = [instance.pk for instance, _ in changes.updates]
+        # in id order, so concurrent bulk requests lock rows in the same order
+        locked = {product.pk: product for product in Product.objects.select_for_update().filter(pk__in=ids).order_by('pk')}
+        groups = defaultdict(list)
+        updated = []
+        for instance, validated_data in changes.updates:
+            product = locked.get(instance.pk)
+            if product is None:
+                continue
+            for attr, value in validated_data.items():
+                setattr(product, attr, value)
+            product.last_update = now
+            if product.collection_id != product._loaded_collection_id:
+                counts[product._loaded_collection_id] -= 1
+                counts[product.collection_id] += 1
+            groups[frozenset(validated_data)].append(product)
+            updated.append(product)
+        for fields, products in groups.items():
+            Product.objects.bulk_update(products, fields=sorted(fields | {'last_update'}), batch_size=chunk_size)
+        created = Product.objects.bulk_create(changes.creates, batch_size=chunk_size)
+        for collection_id, count in counts.items():
+            if count:
+                Collection.objects.add_products(collection_id, count)
+        product_ids = [instance.pk for instance in updated + created if instance.pk is not None]
+        collection_ids = set(counts) | {instance.collection_id for instance in updated}
+        transaction.on_commit(lambda: caching.bump_products(product_ids, collection_ids))
+    return {'created': len(created), 'updated': len(updated)}
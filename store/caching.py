@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+VERSION_KEY = 'store:version:{scope}:{pk}'
+RESPONSE_KEY = 'store:response:{prefix}:{versions}:{digest}'
+STATS_KEY = 'store:response:stats:{name}'
+
+SCOPE_GLOBAL = 'global'
+SCOPE_CATALOG = 'catalog'
+SCOPE_COLLECTION = 'collection'
+SCOPE_PRODUCT = 'product'
+
+HIT = 'hits'
+MISS = 'misses'
+
+
+class LocalCache:
+    """
+    A small thread-safe LRU mapping held in process memory, whose entries expire `ttl`
+    seconds after they are set. For data read on every request that may be briefly stale
+    in other processes.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return default
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def version_key(scope, pk=None):
+    return VERSION_KEY.format(scope=scope, pk=pk if pk is not None else '-')
+
+
+def new_version():
+    """
+    Starting value of a version counter: the time in microseconds, above any value an
+    evicted counter could have reached, so entries cached under it never become current again.
+    """
+    return time.time_ns() // 1000
+
+
+def get_versions(*keys):
+    """Return the current version numbers of `keys` in a single cache round trip (two if one is missing)."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_versions(*keys):
+    for key in set(keys):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # never read, or evicted: restart above any version it had
+            cache.add(key, new_version(), timeout=None)
+
+
+def bump_products(product_ids=(), collection_ids=()):
+    """Invalidate responses of the given products and collections, and every unfiltered listing."""
+    bump_versions(
+        version_key(SCOPE_CATALOG),
+        *[version_key(SCOPE_PRODUCT, pk) for pk in product_ids],
+        *[version_key(SCOPE_COLLECTION, pk) for pk in collection_ids if pk is not None],
+    )
+
+
+def bump_global():
+    """Invalidate every cached response (e.g. a change that affects all products)."""
+    bump_versions(version_key(SCOPE_GLOBAL))
+
+
+def record(name):
+    key = STATS_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    keys = {name: STATS_KEY.format(name=name) for name in [HIT, MISS]}
+    values = cache.get_many(keys.values())
+    return {name: values.get(key, 0) for name, key in keys.items()}
+
+
+def normalize_query(query_params):
+    """Sorted, blank-free representation of a QueryDict, so equivalent requests share a key."""
+    return '&'.join(
+        f'{key}={value}'
+        for key in sorted(query_params)
+        for value in sorted(query_params.getlist(key))
+        if value != ''
+    )
+
+
+def response_key(request, prefix, scope_key):
+    versions = get_versions(version_key(SCOPE_GLOBAL), scope_key)
+    # hyperlinks in the payload are absolute, so the host is part of the key
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{normalize_query(request.query_params)}'
+    return RESPONSE_KEY.format(
+        prefix=prefix,
+        versions='.'.join(str(version) for version in versions),
+        digest=hashlib.md5(raw.encode()).hexdigest(),
+    )
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache for `list` and `retrieve` of a viewset.
+
+    Cached entries are keyed by the normalized request and by version counters, so
+    invalidation is a counter bump (see `store.signals.handlers`) and hits never touch the database.
+    """
+    cache_prefix = None
+    cache_timeout = None
+    # filter parameter that narrows a listing to a single collection
+    cache_collection_param = 'collection_id'
+
+    def get_cache_timeout(self):
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return settings.STORE_RESPONSE_CACHE_TIMEOUT
+
+    def get_list_scope_key(self):
+        collection_id = self.request.query_params.get(self.cache_collection_param)
+        if collection_id and collection_id.isdigit():
+            return version_key(SCOPE_COLLECTION, int(collection_id))
+        return version_key(SCOPE_CATALOG)
+
+    def get_retrieve_scope_key(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return version_key(SCOPE_PRODUCT, self.kwargs[lookup_url_kwarg])
+
+    def cached_response(self, scope_key, compute):
+        key = response_key(self.request, self.cache_prefix, scope_key)
+        data = cache.get(key)
+        if data is not None:
+            record(HIT)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record(MISS)
+        response = compute()
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=self.get_cache_timeout())
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.get_list_scope_key(),
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.get_retrieve_scope_key(),
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,236 @@
+from decimal import Decimal
+from functools import lru_cache
+from uuid import UUID, uuid4
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from store.models import Cart, CartItem, Product
+
+
+def get_cart_storage():
+    return _load_storage(settings.STORE_CART_STORAGE)
+
+
+@lru_cache(maxsize=None)
+def _load_storage(path):
+    return import_string(path)()
+
+
+def parse_cart_id(cart_id):
+    try:
+        return UUID(str(cart_id))
+    except ValueError:
+        return None
+
+
+TOTAL_PRICE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def annotate_item_totals(queryset):
+    # joins the product for its price only, its other columns (e.g. description) aren't loaded
+    return queryset.annotate(total_price=ExpressionWrapper(
+        F('quantity') * F('product__unit_price'),
+        output_field=TOTAL_PRICE_FIELD
+    ))
+
+
+class DatabaseCartStorage:
+    """Carts live in the store_cart / store_cartitem tables."""
+
+    def create(self):
+        cart = Cart.objects.create()
+        cart.total_price = Decimal(0)
+        return cart
+
+    def get(self, cart_id):
+        try:
+            return Cart.objects.annotate(total_price=Coalesce(
+                Sum(ExpressionWrapper(
+                    F('cartitem__quantity') * F('cartitem__product__unit_price'),
+                    output_field=TOTAL_PRICE_FIELD
+                )),
+                Value(Decimal(0)),
+                output_field=TOTAL_PRICE_FIELD
+            )).prefetch_related(
+                Prefetch('cartitem_set', queryset=self.get_items(cart_id))
+            ).filter(pk=cart_id).first()
+        except ValidationError:
+            return None
+
+    def delete(self, cart_id):
+        Cart.objects.filter(pk=cart_id).delete()
+
+    def get_items(self, cart_id):
+        return annotate_item_totals(CartItem.objects.filter(cart=cart_id)).order_by('id')
+
+    def get_item(self, cart_id, item_id):
+        try:
+            return self.get_items(cart_id).filter(pk=item_id).first()
+        except (ValidationError, ValueError):
+            return None
+
+    def add_item(self, cart_id, product_id, quantity):
+        return CartItem.objects.add_quantity(cart_id=cart_id, product_id=product_id, quantity=quantity)
+
+    def set_quantity(self, item, quantity):
+        item.quantity = quantity
+        item.save(update_fields=['quantity'])
+        return item
+
+    def remove_item(self, item):
+        item.delete()
+
+    def flush(self, cart_id):
+        """Make sure the cart is in the relational tables, e.g. before an order is created from it."""
+
+    def discard(self, cart_id):
+        """Forget a cart that has been turned into an order."""
+
+
+class CartItems(list):
+    """Items of a `StoredCart`, readable like the `cartitem_set` related manager."""
+    def all(self):
+        return self
+
+
+class StoredCart:
+    """A cart that lives outside the database, serializable by `CartSerializer`."""
+    def __init__(self, id, created_at, items=()):
+        self.id = self.pk = id
+        self.created_at = created_at
+        self.cartitem_set = CartItems(items)
+        self.total_price = sum((item.total_price for item in items), Decimal(0))
+
+
+class RedisCartStorage:
+    """
+    Carts live in Redis hashes (`created_at` plus one `<product id>: <quantity>` field per
+    item) that expire after STORE_CART_TTL seconds without activity, so abandoned carts
+    never reach the database. A cart is written to the relational tables by `flush` only
+    when an order is created from it.
+
+    Items are addressed by their product id.
+    """
+    key_format = 'store:cart:{}'
+    created_at_field = 'created_at'
+
+    # the cart must exist: a missing key means an expired or unknown cart
+    add_script = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+        local quantity = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return quantity
+    """
+    set_script = """
+        if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then return nil end
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return tonumber(ARGV[2])
+    """
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.add_quantity = self.redis.register_script(self.add_script)
+        self.replace_quantity = self.redis.register_script(self.set_script)
+
+    @property
+    def ttl(self):
+        return settings.STORE_CART_TTL
+
+    def key(self, cart_id):
+        return self.key_format.format(cart_id)
+
+    def read(self, cart_id):
+        """Return (created_at, {product_id: quantity}) of the cart, or None if it doesn't exist."""
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None
+        with self.redis.pipeline() as pipe:
+            pipe.hgetall(self.key(cart_id))
+            pipe.expire(self.key(cart_id), self.ttl)
+            fields, _ = pipe.execute()
+        if not fields:
+            return None
+        created_at = parse_datetime(fields.pop(self.created_at_field.encode()).decode())
+        return created_at, {int(product_id): int(quantity) for product_id, quantity in fields.items()}
+
+    def make_items(self, cart_id, quantities):
+        products = Product.objects.only('id', 'unit_price').in_bulk(list(quantities))
+        items = [
+            CartItem(id=product_id, cart_id=cart_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in sorted(quantities.items())
+            # products deleted since they were added are dropped
+            if product_id in products
+        ]
+        for item in items:
+            item.total_price = item.product.unit_price * item.quantity
+        return items
+
+    def create(self):
+        cart = StoredCart(id=uuid4(), created_at=timezone.now())
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self.key(cart.id), self.created_at_field, cart.created_at.isoformat())
+            pipe.expire(self.key(cart.id), self.ttl)
+            pipe.execute()
+        return cart
+
+    def get(self, cart_id):
+        stored = self.read(cart_id)
+        if stored is None:
+            return None
+        created_at, quantities = stored
+        return StoredCart(cart_id, created_at, self.make_items(cart_id, quantities))
+
+    def delete(self, cart_id):
+        self.redis.delete(self.key(cart_id))
+
+    def get_items(self, cart_id):
+        stored = self.read(cart_id)
+        return self.make_items(cart_id, stored[1]) if stored else []
+
+    def get_item(self, cart_id, item_id):
+        stored = self.read(cart_id)
+        if stored is None or not str(item_id).isdigit() or int(item_id) not in stored[1]:
+            return None
+        return self.make_items(cart_id, {int(item_id): stored[1][int(item_id)]})[0]
+
+    def add_item(self, cart_id, product_id, quantity):
+        if not Product.objects.filter(pk=product_id).exists():
+            raise CartItem.DoesNotExist('Product not found')
+        quantity = self.add_quantity(keys=[self.key(cart_id)], args=[product_id, quantity, self.ttl])
+        if quantity is None:
+            raise Cart.DoesNotExist('Cart not found')
+        return CartItem(id=product_id, cart_id=cart_id, product_id=product_id, quantity=quantity)
+
+    def set_quantity(self, item, quantity):
+        quantity = self.replace_quantity(keys=[self.key(item.cart_id)], args=[item.product_id, quantity, self.ttl])
+        if quantity is None:
+            raise CartItem.DoesNotExist('Cart item not found')
+        item.quantity = quantity
+        return item
+
+    def remove_item(self, item):
+        self.redis.hdel(self.key(item.cart_id), item.product_id)
+
+    def flush(self, cart_id):
+        stored = self.read(cart_id)
+        if stored is None:
+            return
+        cart_id = parse_cart_id(cart_id)
+        with transaction.atomic():
+            Cart.objects.get_or_create(pk=cart_id)
+            # a retried checkout replaces what an earlier attempt wrote
+            CartItem.objects.filter(cart_id=cart_id).delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart_id=cart_id, product_id=item.product_id, quantity=item.quantity)
+                for item in self.make_items(cart_id, stored[1])
+            ])
+
+    def discard(self, cart_id):
+        self.delete(cart_id)
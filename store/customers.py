@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from store import caching
+from store.models import Customer
+
+
+VERSION_KEY = 'store:version:customer:{user_id}'
+PROFILE_KEY = 'store:customer:{user_id}:{version}'
+
+# Customer columns behind CustomerSerializer
+PROFILE_FIELDS = ['id', 'user_id', 'phone', 'birth_date', 'membership']
+
+
+def version_key(user_id):
+    return VERSION_KEY.format(user_id=user_id)
+
+
+def read_profile(user_id):
+    return Customer.objects.filter(user_id=user_id).values(*PROFILE_FIELDS).first()
+
+
+def get_profile(user_id):
+    """
+    Return the customer columns of user `user_id` as a dict, from the cache or with a plain
+    read. The row is created only if it is missing (`create_customer_for_new_user` normally
+    made it when the user signed up).
+    """
+    version = caching.get_versions(version_key(user_id))[0]
+    key = PROFILE_KEY.format(user_id=user_id, version=version)
+    profile = cache.get(key)
+    if profile is not None:
+        return profile
+
+    profile = read_profile(user_id)
+    if profile is None:
+        try:
+            with transaction.atomic():
+                Customer.objects.create(user_id=user_id)
+        except IntegrityError:
+            # created by a concurrent request
+            pass
+        profile = read_profile(user_id)
+    # a save during the read bumped the version, this key is never read again
+    cache.set(key, profile, timeout=settings.STORE_CUSTOMER_PROFILE_TIMEOUT)
+    return profile
+
+
+def update_profile(profile, values):
+    """Write `values` to the customer of `profile` with a single UPDATE, return the new profile."""
+    Customer.objects.filter(pk=profile['id']).update(**values)
+    # UPDATE sends no post_save, invalidate like store.signals.handlers.forget_customer does
+    user_id = profile['user_id']
+    transaction.on_commit(lambda: forget_profile(user_id))
+    return {**profile, **values}
+
+
+def forget_profile(user_id):
+    caching.bump_versions(version_key(user_id))
@@ -0,0 +1,116 @@
+"""
+Order event outbox. Checkout records an `OrderEvent` in its own transaction instead of
+calling signal receivers, and a Celery task sends pending events to the receivers after
+commit, in batches. Delivery is at least once: an event whose receivers failed is sent
+again (to all of them), with exponential backoff, until it succeeds or runs out of
+attempts, so receivers should use the `idempotency_key` they are given to ignore repeats.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from store.models import OrderEvent
+from store.signals import order_created
+
+logger = logging.getLogger(__name__)
+
+
+SIGNALS = {
+    OrderEvent.KIND_CREATED: order_created,
+}
+
+
+def idempotency_key(kind, order_id):
+    return f'order:{order_id}:{kind}'
+
+
+def record(order_id, kind):
+    """Add an event to the outbox of the current transaction, it is dispatched after commit."""
+    from store.tasks import dispatch_order_events, enqueue
+    event = OrderEvent.objects.create(order_id=order_id, kind=kind, idempotency_key=idempotency_key(kind, order_id))
+    # the order is committed whatever the broker says, the beat schedule sends the event if this fails
+    transaction.on_commit(lambda: enqueue(dispatch_order_events))
+    return event
+
+
+def pending(now=None):
+    """Events to send: not sent yet, attempts left, and not claimed by a running dispatcher."""
+    now = now or timezone.now()
+    return OrderEvent.objects.filter(
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        dispatched_at__isnull=True,
+        attempts__lt=settings.STORE_ORDER_EVENT_MAX_ATTEMPTS
+    ).order_by('id')
+
+
+def retry_delay(attempts):
+    """Seconds an event that failed `attempts` times waits before it is sent again."""
+    return settings.STORE_ORDER_EVENT_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def next_retry_at():
+    """When the first failed event waiting for a retry is pending again, None if there are none."""
+    return OrderEvent.objects.filter(
+        claimed_until__isnull=False,
+        dispatched_at__isnull=True,
+        attempts__lt=settings.STORE_ORDER_EVENT_MAX_ATTEMPTS
+    ).aggregate(retry_at=Min('claimed_until'))['retry_at']
+
+
+def claim(batch_size):
+    """
+    Take up to `batch_size` pending events for STORE_ORDER_EVENT_CLAIM_TIMEOUT seconds, in a
+    short transaction of its own. Rows being claimed by another dispatcher are skipped where
+    the database supports SKIP LOCKED; events of a dispatcher that died are taken again once
+    their claim expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = pending(now)
+        if connection.features.has_select_for_update_skip_locked:
+            batch = batch.select_for_update(skip_locked=True)
+        events = list(batch[:batch_size])
+        for event in events:
+            event.attempts += 1
+            event.claimed_until = now + timedelta(seconds=settings.STORE_ORDER_EVENT_CLAIM_TIMEOUT)
+        OrderEvent.objects.bulk_update(events, ['attempts', 'claimed_until'])
+    return events
+
+
+def send(event):
+    """Send `event` to the receivers of its signal, return the errors they raised."""
+    responses = SIGNALS[event.kind].send_robust(
+        sender=OrderEvent,
+        order=event.order_id,
+        event=event.kind,
+        idempotency_key=event.idempotency_key
+    )
+    return [(receiver, response) for receiver, response in responses if isinstance(response, Exception)]
+
+
+def dispatch(batch_size=None):
+    """
+    Claim one batch of pending events and send them, outside of any transaction, so
+    receivers hold no locks. Each event is marked sent (or failed) on its own as soon as
+    its receivers returned; a failed event stays claimed for `retry_delay(attempts)`
+    seconds, so it isn't sent again right away. Returns (sent, failed) counts.
+    """
+    batch_size = batch_size or settings.STORE_ORDER_EVENT_BATCH_SIZE
+    sent = failed = 0
+    for event in claim(batch_size):
+        errors = send(event)
+        if errors:
+            failed += 1
+            last_error = '\n'.join(f'{receiver.__qualname__}: {error!r}' for receiver, error in errors)
+            if event.attempts >= settings.STORE_ORDER_EVENT_MAX_ATTEMPTS:
+                logger.error('Order event %s failed %d times, giving up: %s', event.idempotency_key, event.attempts, last_error)
+            else:
+                logger.warning('Order event %s failed (attempt %d): %s', event.idempotency_key, event.attempts, last_error)
+            retry_at = timezone.now() + timedelta(seconds=retry_delay(event.attempts))
+            OrderEvent.objects.filter(pk=event.pk).update(claimed_until=retry_at, last_error=last_error)
+        else:
+            sent += 1
+            OrderEvent.objects.filter(pk=event.pk).update(claimed_until=None, dispatched_at=timezone.now())
+    return sent, failed
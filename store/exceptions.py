@@ -6,4 +6,13 @@ class PermissonDeniedException(Exception):
         super().__init__(*args)
 
     def render(self):
-        return HttpResponse('hello')
\ No newline at end of file
+        return HttpResponse('hello')
+
+
+class CheckoutError(Exception):
+    """A cart that can't be turned into an order, the message is returned to the client."""
+
+
+class InsufficientInventory(CheckoutError):
+    def __init__(self, *args) -> None:
+        super().__init__(*(args or ['Not enough inventory']))
@@ -0,0 +1,41 @@
+from django.conf import settings
+from store.models import OrderItem
+
+
+ORDER_FIELDS = ['id', 'customer_id', 'placed_at', 'paymentstatus', 'total_amount', 'item_count']
+ORDER_ITEM_FIELDS = ['product_id', 'quantity', 'unit_price']
+# one CSV row per order item, orders without items get a single row
+ORDER_CSV_FIELDS = ORDER_FIELDS + [f'item_{field}' for field in ORDER_ITEM_FIELDS]
+
+
+def iter_orders(queryset, chunk_size=None):
+    """
+    Yield the orders of `queryset` as dicts, each with its `items`, in order of id.
+
+    Orders are read in id ranges of `chunk_size` and the items of each range with a
+    second query, so memory stays constant whatever the size of the export, and no
+    server side cursor is needed (MySQL buffers `.iterator()` results client side).
+    """
+    chunk_size = chunk_size or settings.STORE_EXPORT_CHUNK_SIZE
+    orders = queryset.order_by('id').values(*ORDER_FIELDS)
+    last_id = 0
+    while True:
+        chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        items = {order['id']: [] for order in chunk}
+        rows = OrderItem.objects.filter(order_id__in=items).order_by('order_id', 'id').values_list('order_id', *ORDER_ITEM_FIELDS)
+        for order_id, *values in rows:
+            items[order_id].append(dict(zip(ORDER_ITEM_FIELDS, values)))
+        for order in chunk:
+            order['items'] = items[order['id']]
+            yield order
+        last_id = chunk[-1]['id']
+
+
+def order_item_rows(orders):
+    """Flatten orders from `iter_orders` into one row per item, for CSV."""
+    for order in orders:
+        items = order.pop('items')
+        for item in items or [{}]:
+            yield {**order, **{f'item_{field}': value for field, value in item.items()}}
@@ -1,6 +1,11 @@
-from django.db.models import fields
+import re
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import FilterSet
-from .models import Product
+from rest_framework.filters import SearchFilter
+from . import search
+from .models import Order, Product
 
 class ProductFilter(FilterSet):
     class Meta:
@@ -8,4 +13,78 @@ class ProductFilter(FilterSet):
         fields = {
             'collection_id':['exact'],
             'unit_price':['gt', 'lt']
-        }
\ No newline at end of file
+        }
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'placed_at':['gte', 'lt']
+        }
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Relevance ranked product search with the `?search=` contract of `SearchFilter`.
+
+    On MySQL terms are matched against the FULLTEXT indexes created by migration 0018,
+    elsewhere against the in-process `store.search.InvertedIndex`. An explicit `?ordering=`
+    still takes precedence over relevance.
+    """
+    # innodb_ft_min_token_size, shorter terms are never indexed by MySQL
+    fulltext_min_term_length = 3
+    boolean_mode_operators = re.compile(r'[+\-<>()~*"@]')
+    product_match = 'MATCH (store_product.title, store_product.description) AGAINST (%s IN BOOLEAN MODE)'
+    collection_match = (
+        'store_product.collection_id IN '
+        '(SELECT id FROM store_collection WHERE MATCH (title) AGAINST (%s IN BOOLEAN MODE))'
+    )
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if connections[queryset.db].vendor == 'mysql':
+            return self.fulltext_search(request, queryset, view, terms)
+        return self.index_search(queryset, terms)
+
+    def fulltext_search(self, request, queryset, view, terms):
+        terms = [self.boolean_mode_operators.sub(' ', term).strip() for term in terms]
+        terms = [word for term in terms for word in term.split()]
+        short_terms = [term for term in terms if len(term) < self.fulltext_min_term_length]
+        terms = [term for term in terms if len(term) >= self.fulltext_min_term_length]
+        for term in terms:
+            expression = f'{term}*'
+            queryset = queryset.filter(RawSQL(
+                f'(({self.product_match}) > 0 OR {self.collection_match})',
+                (expression, expression),
+                output_field=BooleanField()
+            ))
+        if short_terms:
+            queryset = self.like_search(queryset, view, short_terms)
+        if terms:
+            queryset = queryset.annotate(search_rank=RawSQL(
+                self.product_match,
+                (' '.join(f'{term}*' for term in terms),),
+                output_field=FloatField()
+            )).order_by('-search_rank', 'id')
+        return queryset
+
+    def like_search(self, queryset, view, terms):
+        search_fields = self.get_search_fields(view, None)
+        for term in terms:
+            condition = Q()
+            for field in search_fields:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def index_search(self, queryset, terms):
+        ranked_ids = search.get_index().search(terms)
+        return queryset.filter(pk__in=ranked_ids).order_by(
+            Case(
+                *[When(pk=pk, then=position) for position, pk in enumerate(ranked_ids)],
+                output_field=IntegerField()
+            ),
+        ) if ranked_ids else queryset.none()
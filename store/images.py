@@ -0,0 +1,41 @@
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.webp'
+
+
+def render_variant(image, size, quality):
+    variant = image.copy()
+    # keeps the aspect ratio, never upscales
+    variant.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=quality)
+    return buffer.getvalue()
+
+
+def make_variants(field_file):
+    """
+    Write a WebP copy of the image per STORE_IMAGE_VARIANTS bound, next to the original
+    in its storage. Returns {variant: stored name}.
+    """
+    storage = field_file.storage
+    variants = {}
+    with storage.open(field_file.name, 'rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+        for variant, size in settings.STORE_IMAGE_VARIANTS.items():
+            content = ContentFile(render_variant(image, size, settings.STORE_IMAGE_VARIANT_QUALITY))
+            variants[variant] = storage.save(variant_name(field_file.name, variant), content)
+    return variants
+
+
+def delete_variants(storage, variants):
+    for name in variants.values():
+        storage.delete(name)
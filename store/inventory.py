@@ -0,0 +1,83 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from store import caching
+from store.exceptions import InsufficientInventory
+from store.models import InventoryReservation, Order, Product
+
+
+def quantity_case(quantities):
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in sorted(quantities.items())],
+        output_field=IntegerField()
+    )
+
+
+def reserve(order, quantities, ttl=None):
+    """
+    Take `quantities` ({product_id: quantity}) out of inventory on behalf of `order`.
+
+    A single conditional UPDATE decrements every product that has enough stock; it locks
+    only the rows it touches, in primary key order, so concurrent checkouts of the same
+    products queue on those rows instead of deadlocking. If any product is short the
+    caller's transaction must roll back, which `InsufficientInventory` does for atomic blocks.
+    """
+    ordered_quantity = quantity_case(quantities)
+    updated = Product.objects.filter(pk__in=quantities, inventory__gte=ordered_quantity) \
+        .update(inventory=F('inventory') - ordered_quantity)
+    if updated != len(quantities):
+        raise InsufficientInventory()
+
+    expires_at = timezone.now() + timedelta(seconds=ttl or settings.STORE_RESERVATION_TTL)
+    return InventoryReservation.objects.bulk_create([
+        InventoryReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in sorted(quantities.items())
+    ])
+
+
+def release(order_ids):
+    """Return the inventory held by `order_ids` and drop their reservations."""
+    with transaction.atomic():
+        # locking the reservations makes concurrent releases of the same order no-ops
+        reservations = list(
+            InventoryReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids)
+            .order_by('product_id')
+            .values_list('id', 'product_id', 'quantity', 'product__collection_id')
+        )
+        if not reservations:
+            return 0
+        quantities = defaultdict(int)
+        for _, product_id, quantity, _ in reservations:
+            quantities[product_id] += quantity
+        Product.objects.filter(pk__in=quantities).update(inventory=F('inventory') + quantity_case(quantities))
+        InventoryReservation.objects.filter(pk__in=[reservation[0] for reservation in reservations]).delete()
+
+        collection_ids = {reservation[3] for reservation in reservations}
+        transaction.on_commit(lambda: caching.bump_products(quantities, collection_ids))
+    return len(reservations)
+
+
+def commit(order_ids):
+    """The orders are paid: their inventory is sold for good."""
+    return InventoryReservation.objects.filter(order_id__in=order_ids).delete()[0]
+
+
+def release_expired(batch_size=None):
+    """Fail pending orders whose reservations expired and return their inventory."""
+    batch_size = batch_size or settings.STORE_RESERVATION_BATCH_SIZE
+    released = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                InventoryReservation.objects.filter(expires_at__lt=timezone.now())
+                .order_by('order_id').values_list('order_id', flat=True).distinct()[:batch_size]
+            )
+            if not order_ids:
+                return released
+            Order.objects.filter(pk__in=order_ids, paymentstatus=Order.STATUS_P) \
+                .update(paymentstatus=Order.STATUS_F)
+            released += release(order_ids)
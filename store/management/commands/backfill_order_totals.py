@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized total_amount and item_count of every order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        updated = 0
+        while True:
+            # walk the primary key so each chunk is an index range, not an OFFSET
+            ids = list(
+                Order.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Order.objects.filter(pk__in=ids).refresh_totals()
+            last_id = ids[-1]
+            self.stdout.write(f'{updated} orders updated (up to id {last_id})')
+        self.stdout.write(self.style.SUCCESS(f'Done, {updated} orders updated'))
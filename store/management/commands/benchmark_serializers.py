@@ -0,0 +1,91 @@
+from decimal import Decimal
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from store.models import Collection, Product
+from store.serializers import PriceWithTaxField, TemplatedHyperlinkedRelatedField
+
+
+class LegacyPriceSerializer(serializers.ModelSerializer):
+    # ProductSerializer.price_with_tax before it became a plain field read
+    class Meta:
+        model = Product
+        fields = ['id', 'price_with_tax']
+
+    price_with_tax = serializers.SerializerMethodField(read_only=True, method_name='price_with_tax_method')
+
+    def price_with_tax_method(self, product: Product):
+        return Decimal(product.unit_price * Decimal(1.05))
+
+
+class PriceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'price_with_tax']
+
+    price_with_tax = PriceWithTaxField()
+
+
+class LegacyCollectionLinkSerializer(serializers.ModelSerializer):
+    # ProductSerializer.collection before the url template
+    class Meta:
+        model = Product
+        fields = ['id', 'collection']
+
+    collection = serializers.HyperlinkedRelatedField(queryset=Collection.objects.all(), view_name='store:collection-detail')
+
+
+class CollectionLinkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'collection']
+
+    collection = TemplatedHyperlinkedRelatedField(queryset=Collection.objects.all(), view_name='store:collection-detail')
+
+
+class Command(BaseCommand):
+    help = 'Measures serializer throughput over in-memory products (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def get_cases(self, products):
+        # a fresh request per run, the url base is cached on it
+        context = lambda: {'request': Request(APIRequestFactory().get('/store/products/'))}
+        return {
+            'price_with_tax (method field)': lambda: LegacyPriceSerializer(products, many=True).data,
+            'price_with_tax (annotation)': lambda: PriceSerializer(products, many=True).data,
+            'collection (reverse per row)': lambda: LegacyCollectionLinkSerializer(products, many=True, context=context()).data,
+            'collection (url template)': lambda: CollectionLinkSerializer(products, many=True, context=context()).data,
+        }
+
+    def make_products(self, count):
+        products = []
+        for pk in range(1, count + 1):
+            product = Product(id=pk, title=f'Product {pk}', slug=f'product-{pk}',
+                unit_price=Decimal(pk % 1000 + 1) / 10, inventory=pk % 100, collection_id=pk % 10 + 1)
+            # what ProductViewSet.get_queryset annotates
+            product.price_with_tax = product.unit_price * Decimal('1.05')
+            products.append(product)
+        return products
+
+    # the requests of the hyperlink cases come from APIRequestFactory's test server
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        products = self.make_products(options['count'])
+        for name, case in self.get_cases(products).items():
+            best = min(self.measure(case) for _ in range(options['repeat']))
+            self.stdout.write(
+                f'{name}: {best * 1000:.1f} ms, '
+                f'{len(products) / best:,.0f} rows/s, '
+                f'{best / len(products) * 1e6:.2f} us/row'
+            )
+
+    def measure(self, case):
+        start = perf_counter()
+        case()
+        return perf_counter() - start
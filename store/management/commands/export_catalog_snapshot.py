@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Exports the whole catalog to a binary snapshot (see store.snapshot)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Defaults to STORE_SNAPSHOT_PATH')
+        parser.add_argument('--region', help='Tax region of price_with_tax, defaults to STORE_TAX_REGION')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        result = snapshot.export(path=options['path'], region=options['region'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done, {result['products']} products, {result['strings']} strings, {result['bytes']} bytes"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from store.models import ProductImage
+from store.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Queues the WebP variants of product images that have none (e.g. uploaded before variants existed, or given up on by the sweep)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate every image, e.g. after STORE_IMAGE_VARIANTS changed')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        queued = 0
+        for image_id in images.values_list('id', flat=True).iterator():
+            generate_image_variants.delay(image_id)
+            queued += 1
+        self.stdout.write(self.style.SUCCESS(f'Done, {queued} images queued'))
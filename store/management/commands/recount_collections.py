@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from store.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized product_count of collections, reporting the ones that had drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection_ids', nargs='*', type=int, help='Collections to recount, all by default')
+
+    def handle(self, *args, **options):
+        collections = Collection.objects.all()
+        if options['collection_ids']:
+            collections = collections.filter(pk__in=options['collection_ids'])
+        before = dict(collections.values_list('pk', 'product_count'))
+        collections.recount()
+        after = dict(collections.values_list('pk', 'product_count'))
+        drifted = 0
+        for pk, count in sorted(after.items()):
+            if before.get(pk) != count:
+                drifted += 1
+                self.stdout.write(f'collection {pk}: {before.get(pk)} -> {count}')
+        self.stdout.write(self.style.SUCCESS(f'Done, {len(after)} collections recounted, {drifted} corrected'))
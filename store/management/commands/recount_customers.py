@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from store.models import Customer
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized orders_count of customers, reporting the ones that had drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_ids', nargs='*', type=int, help='Customers to recount, all by default')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['customer_ids']:
+            customers = customers.filter(pk__in=options['customer_ids'])
+        before = dict(customers.values_list('pk', 'orders_count'))
+        customers.recount()
+        after = dict(customers.values_list('pk', 'orders_count'))
+        drifted = 0
+        for pk, count in sorted(after.items()):
+            if before.get(pk) != count:
+                drifted += 1
+                self.stdout.write(f'customer {pk}: {before.get(pk)} -> {count}')
+        self.stdout.write(self.style.SUCCESS(f'Done, {len(after)} customers recounted, {drifted} corrected'))
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+FULLTEXT_INDEXES = [
+    ('store_product', 'store_product_title_description_ft', 'title, description'),
+    ('store_collection', 'store_collection_title_ft', 'title'),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    # FULLTEXT is MySQL specific, other backends search through store.search.InvertedIndex
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'CREATE FULLTEXT INDEX {name} ON {table} ({columns})')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX {name} ON {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_alter_product_promotions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:37
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_product_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(max_length=16)),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=5, validators=[django.core.validators.MinValueValidator(0)])),
+                ('collection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.collection')),
+            ],
+            options={
+                'unique_together': {('region', 'collection')},
+            },
+        ),
+    ]
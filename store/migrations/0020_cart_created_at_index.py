@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_taxrate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_cart_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_inventoryreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_review_summaries(apps, schema_editor):
+    Review = apps.get_model('store', 'Review')
+    ReviewSummary = apps.get_model('store', 'ReviewSummary')
+    counts = Review.objects.order_by().values_list('product_id').annotate(count=models.Count('id'))
+    summaries = []
+    for product_id, count in counts.iterator():
+        latest = Review.objects.filter(product_id=product_id).order_by('-date', '-id')[:settings.STORE_REVIEW_SUMMARY_SIZE]
+        summaries.append(ReviewSummary(
+            product_id=product_id,
+            review_count=count,
+            latest=[{'id': review.id, 'title': review.title, 'date': review.date.isoformat()} for review in latest]
+        ))
+    ReviewSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_summary', serialize=False, to='store.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('latest', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'date'], name='store_revie_product_a44095_idx'),
+        ),
+        migrations.RunPython(build_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    Product = apps.get_model('store', 'Product')
+    products = Product.objects.filter(collection=models.OuterRef('pk')).order_by().values('collection')
+    Collection.objects.update(product_count=Coalesce(
+        models.Subquery(products.annotate(count=models.Count('pk')).values('count')),
+        models.Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_reviewsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='product_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
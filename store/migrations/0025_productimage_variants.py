@@ -0,0 +1,25 @@
+# Generated by Django 3.2.7 on 2026-10-18 13:55
+
+from django.db import migrations, models
+import store.models
+import store.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_collection_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(upload_to=store.models.ProductImage.Utils.get_product_title, validators=[store.validators.FileSizeValidator(max_file_size_mb=1), store.validators.ImagePixelsValidator(max_pixels=40000000)]),
+        ),
+    ]
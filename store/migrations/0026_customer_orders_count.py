@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_orders(apps, schema_editor):
+    Customer = apps.get_model('store', 'Customer')
+    Order = apps.get_model('store', 'Order')
+    orders = Order.objects.filter(customer=models.OuterRef('pk')).order_by().values('customer')
+    Customer.objects.update(orders_count=Coalesce(
+        models.Subquery(orders.annotate(count=models.Count('pk')).values('count')),
+        models.Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='orders_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderevent',
+            name='claimed_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_orderevent_claimed_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='variants_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -1,29 +1,67 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.db.models import fields
 from django.db.models.aggregates import Min
 from django.db.models.base import Model
 from django.db.models.deletion import CASCADE, PROTECT, SET_NULL
 from django.db.models.fields import related
+from django.db.models.functions import Coalesce
 from django.core.validators import FileExtensionValidator, MinValueValidator
 from uuid import uuid4
-from store.validators import FileSizeValidator
+from store.validators import FileSizeValidator, ImagePixelsValidator
 from django.conf import settings
 
 from rest_framework import validators
 
 
+class DenormalizedFieldsMixin:
+    """
+    The `denormalized_fields` of a model are only written by queryset updates (F()
+    expressions, recounts); saving an existing instance leaves them out, so the values it
+    loaded can't overwrite changes made since.
+    """
+    denormalized_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.denormalized_fields]
+        super().save(*args, **kwargs)
+
+
 # Promotion - Product many to many
 class Promotion(models.Model):
     description = models.CharField(max_length=255)
     discount =  models.FloatField()
 
 
-class Collection(models.Model):
+class CollectionQuerySet(models.QuerySet):
+    def recount(self):
+        """Recompute product_count of the collections from their products, in one UPDATE."""
+        products = Product.objects.filter(collection=models.OuterRef('pk')).order_by().values('collection')
+        return self.update(product_count=Coalesce(
+            models.Subquery(products.annotate(count=models.Count('pk')).values('count')),
+            models.Value(0)
+        ))
+
+    def add_products(self, collection_id, count):
+        """Add `count` (possibly negative) to the product_count of a collection, without reading it."""
+        return self.filter(pk=collection_id).update(product_count=models.F('product_count') + count)
+
+
+class Collection(DenormalizedFieldsMixin, models.Model):
     class Meta:
         ordering = ['title']
 
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey('Product', on_delete=SET_NULL, null=True, related_name='+')
+    # denormalized from the products, kept up to date by the Product signal handlers
+    # (see recount_collections for repairs)
+    product_count = models.IntegerField(default=0, editable=False)
+    denormalized_fields = ['product_count']
+
+    objects = CollectionQuerySet.as_manager()
     
     def __str__(self) -> str:
         return self.title
@@ -43,10 +81,30 @@ class Product(models.Model):
     collection = models.ForeignKey(Collection, on_delete=PROTECT)
     promotions = models.ManyToManyField(Promotion, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the collection as loaded, so handlers can tell when a product moves
+        instance._loaded_collection_id = instance.__dict__.get('collection_id')
+        return instance
+
     def __str__(self) -> str:
         return self.title
 
 
+class TaxRate(models.Model):
+    # a rate without collection applies to every collection of the region
+    region = models.CharField(max_length=16)
+    collection = models.ForeignKey(Collection, on_delete=CASCADE, null=True, blank=True)
+    rate = models.DecimalField(max_digits=5, decimal_places=4, validators=[MinValueValidator(0)])
+
+    class Meta:
+        unique_together = [['region', 'collection']]
+
+    def __str__(self) -> str:
+        return f'{self.region} {self.collection or "*"}: {self.rate}'
+
+
 class ProductImage(models.Model):
     class Utils:
         def get_product_title(instance, filename):
@@ -55,11 +113,38 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image = models.ImageField(
         upload_to=Utils.get_product_title,
-        validators=[FileSizeValidator(max_file_size_mb=1)]
+        validators=[FileSizeValidator(max_file_size_mb=1), ImagePixelsValidator(max_pixels=40_000_000)]
     )
+    # {variant: stored name} of the resized WebP copies, filled in by
+    # store.tasks.generate_image_variants after the upload
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    # why store.tasks.generate_missing_image_variants could not make the variants, the
+    # sweep skips the image from then on
+    variants_error = models.TextField(blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the file as loaded, so handlers only process replaced images
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+
+class CustomerQuerySet(models.QuerySet):
+    def recount(self):
+        """Recompute orders_count of the customers from their orders, in one UPDATE."""
+        orders = Order.objects.filter(customer=models.OuterRef('pk')).order_by().values('customer')
+        return self.update(orders_count=Coalesce(
+            models.Subquery(orders.annotate(count=models.Count('pk')).values('count')),
+            models.Value(0)
+        ))
+
+    def add_orders(self, customer_id, count):
+        """Add `count` (possibly negative) to the orders_count of a customer, without reading it."""
+        return self.filter(pk=customer_id).update(orders_count=models.F('orders_count') + count)
 
 
-class Customer(models.Model):
+class Customer(DenormalizedFieldsMixin, models.Model):
     MEMBER_SHIP_B = 'B'
     MEMBER_SHIP_S = 'S'
     MEMBER_SHIP_G = 'G'
@@ -72,6 +157,12 @@ class Customer(models.Model):
     birth_date = models.DateField(null=True)
     membership = models.CharField(max_length=1, choices=MEMBER_SHIP, default=MEMBER_SHIP_B)
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=CASCADE)
+    # denormalized from the orders, kept up to date by the Order signal handlers
+    # (see recount_customers for repairs)
+    orders_count = models.IntegerField(default=0, editable=False)
+    denormalized_fields = ['orders_count']
+
+    objects = CustomerQuerySet.as_manager()
 
     # Part1 - 4 - 5
     class Meta: 
@@ -85,7 +176,24 @@ class Customer(models.Model):
         return f'{self.user.first_name} {self.user.last_name}'
 
 
-class Order(models.Model):
+class OrderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """Recompute total_amount and item_count of the orders from their items, in one UPDATE."""
+        items = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+        return self.update(
+            total_amount=Coalesce(
+                models.Subquery(items.annotate(total=models.Sum(models.F('unit_price') * models.F('quantity'))).values('total')),
+                models.Value(0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+            item_count=Coalesce(
+                models.Subquery(items.annotate(count=models.Count('pk')).values('count')),
+                models.Value(0)
+            ),
+        )
+
+
+class Order(DenormalizedFieldsMixin, models.Model):
     STATUS_P = 'P'
     STATUS_C = 'C'
     STATUS_F = 'F'
@@ -97,12 +205,27 @@ class Order(models.Model):
     paymentstatus = models.CharField(max_length=1, choices=PAYMENT_STATUS, default=STATUS_P)
     placed_at = models.DateTimeField(auto_now=True)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
+    # denormalized from the order items, see OrderQuerySet.refresh_totals
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    denormalized_fields = ['total_amount', 'item_count']
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the status as loaded, so handlers can react to payment outcomes
+        instance._loaded_paymentstatus = instance.__dict__.get('paymentstatus')
+        # and the customer, so handlers can tell when an order moves to another customer
+        instance._loaded_customer_id = instance.__dict__.get('customer_id')
+        return instance
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=PROTECT, related_name='orderitem_set')
@@ -111,6 +234,36 @@ class OrderItem(models.Model):
     unit_price = models.DecimalField(max_digits=5, decimal_places=1) # at the time we buy
 
 
+class InventoryReservation(models.Model):
+    # inventory held by a pending order, returned unless the order is paid before expires_at
+    order = models.ForeignKey(Order, on_delete=CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class OrderEvent(models.Model):
+    """
+    Outbox of order events: written in the transaction that changes the order, and sent to
+    the receivers of the matching signal after commit by `store.events.dispatch`.
+    """
+    KIND_CREATED = 'created'
+    KINDS = [
+        (KIND_CREATED, 'Order created'),
+    ]
+    order = models.ForeignKey(Order, on_delete=CASCADE, related_name='events')
+    kind = models.CharField(max_length=32, choices=KINDS)
+    # passed to receivers, which may see an event more than once
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # null until every receiver succeeded; indexed for the dispatcher's scan
+    dispatched_at = models.DateTimeField(null=True, db_index=True)
+    # set while a dispatcher sends the event, see store.events.claim
+    claimed_until = models.DateTimeField(null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+
 class Adress(models.Model):
     street = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
@@ -120,10 +273,45 @@ class Adress(models.Model):
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # indexed for store.tasks.delete_stale_carts
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class CartItemManager(models.Manager):
+    def add_quantity(self, cart_id, product_id, quantity):
+        """
+        Insert the item, or add `quantity` to the existing (cart, product) item, in a single
+        atomic statement. Returns the resulting item without reading it back.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        db_cart_id = self.model._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                # LAST_INSERT_ID(id) makes the id of an updated row available as lastrowid
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) '
+                    'ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), '
+                    'quantity = (@cartitem_quantity := quantity + VALUES(quantity))',
+                    [db_cart_id, product_id, quantity]
+                )
+                item_id = cursor.lastrowid
+                if cursor.rowcount != 1:
+                    cursor.execute('SELECT @cartitem_quantity')
+                    (quantity,) = cursor.fetchone()
+            else:
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) '
+                    f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity '
+                    'RETURNING id, quantity',
+                    [db_cart_id, product_id, quantity]
+                )
+                item_id, quantity = cursor.fetchone()
+        return self.model(id=item_id, cart_id=cart_id, product_id=product_id, quantity=quantity)
 
 
 class CartItem(models.Model):
+    objects = CartItemManager()
     cart = models.ForeignKey(Cart, on_delete=CASCADE)
     product = models.ForeignKey(Product, on_delete=CASCADE)
     quantity = models.PositiveSmallIntegerField(
@@ -140,3 +328,56 @@ class Review(models.Model):
     description = models.TextField(null=True, blank=True)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'date'])
+        ]
+
+
+class ReviewSummaryManager(models.Manager):
+    """Keeps the summary of a product in step with its reviews, one review at a time."""
+
+    @staticmethod
+    def entry(review):
+        return {'id': review.id, 'title': review.title, 'date': review.date.isoformat()}
+
+    def latest_entries(self, product_id):
+        reviews = Review.objects.filter(product_id=product_id).only('id', 'title', 'date')
+        return [self.entry(review) for review in reviews.order_by('-date', '-id')[:settings.STORE_REVIEW_SUMMARY_SIZE]]
+
+    def add(self, review):
+        with transaction.atomic(using=self.db):
+            summary, _ = self.select_for_update().get_or_create(product_id=review.product_id)
+            summary.review_count += 1
+            summary.latest = [self.entry(review)] + summary.latest[:settings.STORE_REVIEW_SUMMARY_SIZE - 1]
+            summary.save()
+
+    def change(self, review):
+        with transaction.atomic(using=self.db):
+            summary = self.select_for_update().filter(product_id=review.product_id).first()
+            if summary is None or not any(entry['id'] == review.id for entry in summary.latest):
+                return
+            summary.latest = [self.entry(review) if entry['id'] == review.id else entry for entry in summary.latest]
+            summary.save(update_fields=['latest'])
+
+    def remove(self, review):
+        with transaction.atomic(using=self.db):
+            # gone already when the product itself is being deleted
+            summary = self.select_for_update().filter(product_id=review.product_id).first()
+            if summary is None:
+                return
+            summary.review_count = max(summary.review_count - 1, 0)
+            if any(entry['id'] == review.id for entry in summary.latest):
+                summary.latest = self.latest_entries(review.product_id)
+            summary.save()
+
+
+class ReviewSummary(models.Model):
+    # denormalized from the reviews of the product, see ReviewSummaryManager
+    product = models.OneToOneField(Product, on_delete=CASCADE, primary_key=True, related_name='review_summary')
+    review_count = models.PositiveIntegerField(default=0)
+    # the STORE_REVIEW_SUMMARY_SIZE most recent reviews, newest first
+    latest = models.JSONField(default=list)
+
+    objects = ReviewSummaryManager()
+
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import Http404
+from rest_framework import exceptions
+from store import caching
+from store.models import Product
+
+
+# ids of products known to exist. Deleting a product forgets it in this process, other
+# processes may keep it for up to STORE_KNOWN_PRODUCTS_TTL seconds.
+known_products = caching.LocalCache(
+    maxsize=settings.STORE_KNOWN_PRODUCTS_SIZE,
+    ttl=settings.STORE_KNOWN_PRODUCTS_TTL
+)
+
+
+def product_exists(product_id):
+    if known_products.get(product_id):
+        return True
+    exists = Product.objects.filter(pk=product_id).exists()
+    if exists:
+        known_products.set(product_id, True)
+    return exists
+
+
+def forget_product(product_id):
+    known_products.delete(product_id)
+
+
+class NestedProductMixin:
+    """
+    For viewsets routed under /products/<product_pk>/. The parent product is validated by
+    the query serving the request; it is only looked up when that query comes back empty,
+    to tell "no reviews yet" from "no such product", and then mostly from `known_products`.
+    """
+    product_lookup_kwarg = 'product_pk'
+    product_not_found_message = 'Product not found'
+
+    @property
+    def product_id(self):
+        try:
+            return int(self.kwargs[self.product_lookup_kwarg])
+        except ValueError:
+            raise exceptions.NotFound(self.product_not_found_message)
+
+    def check_product(self):
+        if not product_exists(self.product_id):
+            raise exceptions.NotFound(self.product_not_found_message)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        results = response.data
+        if isinstance(results, dict):
+            results = results.get('results')
+        if not results:
+            self.check_product()
+        return response
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            self.check_product()
+            raise
+
+    def perform_create(self, serializer):
+        self.check_product()
+        try:
+            super().perform_create(serializer)
+        except IntegrityError:
+            # deleted by another process since it was remembered
+            forget_product(self.product_id)
+            raise exceptions.NotFound(self.product_not_found_message)
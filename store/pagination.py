@@ -1,4 +1,135 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination on (ordering field, id): no OFFSET and no COUNT(*), so the cost of a
+    page does not depend on its depth. Cursors are opaque and only valid for the ordering
+    they were issued with.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    # `?pagination=keyset` opts in on the first page, later pages carry a cursor
+    mode_query_param = 'pagination'
+    mode = 'keyset'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    tiebreak_field = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (request.query_params.get(cls.mode_query_param) == cls.mode
+            or cls.cursor_query_param in request.query_params)
+
+    def get_ordering(self, request, view):
+        ordering_fields = getattr(view, 'ordering_fields', None) or []
+        for term in request.query_params.get(self.ordering_query_param, '').split(','):
+            term = term.strip()
+            if term.lstrip('-') in ordering_fields:
+                return term.lstrip('-'), term.startswith('-')
+        return self.tiebreak_field, False
+
+    def encode_cursor(self, instance, reverse):
+        position = {
+            'f': self.field,
+            'v': getattr(instance, self.field),
+            'i': getattr(instance, self.tiebreak_field),
+            'r': reverse,
+        }
+        payload = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if position['f'] != self.field:
+                raise ValueError
+            return position['v'], position['i'], bool(position['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not isinstance(queryset, QuerySet):
+            # e.g. cart items kept outside the database, returned whole
+            return None
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        self.field, descending = self.get_ordering(request, view)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        # walking backwards is walking forwards over the inverted ordering
+        step_down = descending != reverse
+        prefix = '-' if step_down else ''
+        if self.field == self.tiebreak_field:
+            queryset = queryset.order_by(prefix + self.field)
+        else:
+            queryset = queryset.order_by(prefix + self.field, prefix + self.tiebreak_field)
+
+        if cursor is not None:
+            value, pk, _ = cursor
+            lookup = 'lt' if step_down else 'gt'
+            seek = Q(**{f'{self.tiebreak_field}__{lookup}': pk})
+            if self.field != self.tiebreak_field:
+                seek = Q(**{f'{self.field}__{lookup}': value}) | (Q(**{self.field: value}) & seek)
+            queryset = queryset.filter(seek)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next = self.previous = None
+        if results:
+            if has_more or reverse:
+                self.next = self.encode_cursor(results[-1], reverse=False)
+            if cursor is not None and (has_more or not reverse):
+                self.previous = self.encode_cursor(results[0], reverse=True)
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next),
+            ('previous', self.previous),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class KeysetSelectableMixin:
+    """Let a request opt into `KeysetPagination` instead of the view's `pagination_class`."""
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.keyset_pagination_class.is_requested(self.request):
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
@@ -0,0 +1,22 @@
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Newline delimited JSON, parsed into a list with one item per non-blank line."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        for number, line in enumerate(stream, start=1):
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+        return rows
@@ -0,0 +1,44 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes, so rows can be yielded."""
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON, one object per line. `render_rows` streams it."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # whole responses, e.g. errors
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.render_rows(rows)).encode(self.charset)
+
+    def render_rows(self, rows, fields=None):
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV of flat rows with a header line. `render_rows` streams it."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return ''.join(self.render_rows(rows, fields)).encode(self.charset)
+
+    def render_rows(self, rows, fields):
+        writer = csv.DictWriter(Echo(), fieldnames=fields, extrasaction='ignore')
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
@@ -0,0 +1,86 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from store import caching
+from store.models import Product
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# relative weight of a term occurrence, per indexed field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'collection__title': 2.0,
+    'description': 1.0,
+}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """
+    In-process product search index used where the database has no FULLTEXT support
+    (SQLite, test runs). Matching keeps the `icontains` contract of `SearchFilter`: a
+    search term matches every indexed token that contains it.
+    """
+    def __init__(self, rows):
+        # token -> {product_id: weighted term frequency}
+        self.postings = defaultdict(lambda: defaultdict(float))
+        self.size = 0
+        for row in rows:
+            self.size += 1
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(row[field]):
+                    self.postings[token][row['id']] += weight
+        self.postings = {token: dict(postings) for token, postings in self.postings.items()}
+
+    def scores_for(self, term):
+        scores = defaultdict(float)
+        for token, postings in self.postings.items():
+            if term not in token:
+                continue
+            idf = math.log(1 + self.size / len(postings))
+            for product_id, frequency in postings.items():
+                scores[product_id] += frequency * idf
+        return scores
+
+    def search(self, terms):
+        """Return ids of the products matching every term, best match first."""
+        ranked = None
+        for term in terms:
+            scores = self.scores_for(term.lower())
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {pk: score + scores[pk] for pk, score in ranked.items() if pk in scores}
+            if not ranked:
+                return []
+        return sorted(ranked, key=lambda pk: (-ranked[pk], pk))
+
+
+_index = None
+_index_versions = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The index of the current catalog, rebuilt when a product or collection changes."""
+    global _index, _index_versions
+    versions = caching.get_versions(
+        caching.version_key(caching.SCOPE_GLOBAL),
+        caching.version_key(caching.SCOPE_CATALOG),
+    )
+    with _index_lock:
+        if _index is None or versions != _index_versions:
+            rows = Product.objects.values('id', *FIELD_WEIGHTS).iterator()
+            _index, _index_versions = InvertedIndex(rows), versions
+        return _index
+
+
+def reset_index():
+    global _index, _index_versions
+    with _index_lock:
+        _index = _index_versions = None
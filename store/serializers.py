@@ -3,17 +3,67 @@ from django.db.models.query import QuerySet
 from django.http.response import Http404, HttpResponseNotFound
 from django.shortcuts import get_object_or_404
 from django.utils import translation
-from django.db import transaction
+from django.urls import NoReverseMatch, get_script_prefix
+from django.utils.http import RFC3986_SUBDELIMS
+from urllib.parse import quote
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
 from rest_framework import serializers, status
 from decimal import Decimal
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.fields import empty
+from rest_framework.settings import api_settings
 
-from rest_framework.permissions import OR
+from rest_framework.permissions import OR, SAFE_METHODS
 from rest_framework.response import Response
 
-from store.models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, ProductImage, Promotion, Review
-from .signals import order_created
+from store.models import Cart, CartItem, Customer, Order, OrderEvent, OrderItem, Product, Collection, ProductImage, Promotion, Review, ReviewSummary
+from . import caching, events, inventory, tax
+from .carts import get_cart_storage
+from .exceptions import CheckoutError
+
+def prefetch_from_memory(instance, related_name, objects):
+    """Fill the prefetch cache of `instance.<related_name>` with objects already in memory."""
+    queryset = getattr(instance, related_name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[related_name] = queryset
+
+
+def get_query_names(request, param):
+    """Names passed in `?<param>=a,b`."""
+    if request is None:
+        return set()
+    return {name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+
+
+def get_expanded(request):
+    return get_query_names(request, 'expand')
+
+
+class DynamicFieldsMixin:
+    """
+    Fields named in `Meta.expandable_fields` are only serialized when requested with
+    `?expand=`, and reads may narrow the output to `?fields=a,b` (plus any expansions).
+    Unknown names in `?fields=` are rejected. Writes always go through the full serializer.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expanded = get_expanded(request)
+        selected = get_query_names(request, 'fields')
+        unknown = selected - set(self.fields)
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown fields: {", ".join(sorted(unknown))}']})
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expanded:
+                self.fields.pop(name, None)
+        if selected and request.method in SAFE_METHODS:
+            for name in set(self.fields) - selected - expanded:
+                self.fields.pop(name)
+
 
 class SpecificPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
     def __init__(self, **kwargs):
@@ -23,6 +73,79 @@ class SpecificPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
     def get_queryset(self):
         return super().get_queryset().filter(pk=self.context['request'].parser_context['kwargs'][self.pk_kw])
 
+class TemplatedHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """
+    `HyperlinkedRelatedField` that reverses its view once per process, with a placeholder
+    as lookup value, and only formats the lookup value of each row into that template.
+    The scheme and host are resolved once per request. Falls back to `reverse()` for
+    format suffixes, versioned APIs and routes the placeholder can't be reversed into.
+    """
+    placeholder = 'lookup_placeholder'
+    # what reverse() leaves unquoted in a path
+    safe_characters = RFC3986_SUBDELIMS + '/~:@'
+    url_templates = {}
+
+    def get_url_template(self, view_name, request):
+        key = (getattr(request, 'urlconf', None), get_script_prefix(), view_name, self.lookup_url_kwarg)
+        try:
+            return self.url_templates[key]
+        except KeyError:
+            pass
+        try:
+            path = self.reverse(view_name, kwargs={self.lookup_url_kwarg: self.placeholder})
+        except NoReverseMatch:
+            template = None
+        else:
+            template = path.replace('%', '%%').replace(self.placeholder, '%s') if path.count(self.placeholder) == 1 else None
+        self.url_templates[key] = template
+        return template
+
+    def get_request_template(self, view_name, request, format):
+        """The absolute url template for `request`, resolved on its first row."""
+        cached = getattr(self, '_request_template', None)
+        if cached is not None and cached[0] is request and cached[1] == format:
+            return cached[2]
+        template = None
+        if format is None and getattr(request, 'versioning_scheme', None) is None:
+            template = self.get_url_template(view_name, request)
+            if template is not None and request is not None:
+                template = request.build_absolute_uri('/')[:-1].replace('%', '%%') + template
+        self._request_template = (request, format, template)
+        return template
+
+    def get_url(self, obj, view_name, request, format):
+        template = self.get_request_template(view_name, request, format)
+        if template is None:
+            return super().get_url(obj, view_name, request, format)
+        # unsaved objects don't have a url
+        if hasattr(obj, 'pk') and obj.pk in (None, ''):
+            return None
+        return template % quote(str(getattr(obj, self.lookup_field)), safe=self.safe_characters)
+
+
+class PriceWithTaxField(serializers.DecimalField):
+    """Reads the `price_with_tax` annotation (see `store.tax`), computing it only when absent."""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', tax.PRICE_FIELD.max_digits)
+        kwargs.setdefault('decimal_places', tax.PRICE_FIELD.decimal_places)
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.exponent = Decimal(1).scaleb(-self.decimal_places)
+
+    def to_representation(self, value):
+        # DecimalField builds a new context per value, a plain quantize is enough for output
+        value = value.quantize(self.exponent)
+        if getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return str(value)
+        return value
+
+    def get_attribute(self, instance):
+        try:
+            return instance.price_with_tax
+        except AttributeError:
+            return tax.price_with_tax(instance, tax.get_region(self.context.get('request')))
+
+
 class CollectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Collection
@@ -34,27 +157,55 @@ class CollectionSerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
+
+    # empty until store.tasks.generate_image_variants has run
+    variants = serializers.SerializerMethodField(method_name='get_variant_urls')
+
+    def get_variant_urls(self, product_image: ProductImage):
+        storage = ProductImage._meta.get_field('image').storage
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in product_image.variants.items():
+            url = storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request is not None else url
+        return urls
 
     def create(self, validated_data):
         validated_data['product_id'] = self.context['product_id']
         return super().create(validated_data)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ReviewSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReviewSummary
+        fields = ['review_count', 'latest']
+
+    def get_attribute(self, instance):
+        # products without reviews have no summary row, they get an empty one
+        summary = super().get_attribute(instance)
+        return summary if summary is not None else ReviewSummary()
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'title', 'description', 'slug', 'unit_price', 'inventory', 'collection', 'price_with_tax', 'productimage_set']
+        fields = ['id', 'title', 'description', 'slug', 'unit_price', 'inventory', 'collection', 'price_with_tax', 'productimage_set', 'review_summary']
+        expandable_fields = ['review_summary']
 
     productimage_set = ProductImageSerializer(many=True, read_only=True)
-    price_with_tax = serializers.SerializerMethodField(read_only=True, method_name='price_with_tax_method')
-    collection = serializers.HyperlinkedRelatedField(
+    price_with_tax = PriceWithTaxField()
+    review_summary = ReviewSummarySerializer(read_only=True)
+    collection = TemplatedHyperlinkedRelatedField(
         queryset=Collection.objects.all(),
         view_name='store:collection-detail',
     )
 
-    def price_with_tax_method(self, product: Product):
-        return Decimal(product.unit_price * Decimal(1.05))  
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        # the annotation was computed from the old price
+        instance.__dict__.pop('price_with_tax', None)
+        return instance
 
     def validate(self, attrs):
         return super().validate(attrs)
@@ -79,14 +230,14 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'quantity', 'cart_item_total_price']
     
     product = serializers.PrimaryKeyRelatedField(read_only=True)
-    cart_item_total_price = serializers.SerializerMethodField(
-        read_only=True,
-        method_name='cart_item_total_price_method'
+    # annotated by the cart storage, see store.carts
+    cart_item_total_price = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        source='total_price',
+        read_only=True
     )
 
-    def cart_item_total_price_method(self, cartitem: CartItem):
-        return Decimal(cartitem.product.unit_price * cartitem.quantity)
-
 
 class AddCartItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -96,17 +247,16 @@ class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField(min_value=1)
 
     def save(self, **kwargs):
-        self.validated_data['cart_id'] = self.context['cart_id']
+        # front-end send new 'POST' for an existing item, quantities add up
         try:
-            self.instance = CartItem.objects.get(
-                cart_id=self.validated_data['cart_id'],
-                product_id=self.validated_data['product_id']
+            self.instance = get_cart_storage().add_item(
+                cart_id=self.context['cart_id'],
+                product_id=self.validated_data['product_id'],
+                quantity=self.validated_data['quantity']
             )
-            # front-end send new 'POST'
-            self.validated_data['quantity'] += self.instance.quantity
-        except CartItem.DoesNotExist:
-            pass
-        return super().save(**kwargs)
+        except (IntegrityError, ObjectDoesNotExist, DjangoValidationError):
+            raise ValidationError({'product_id': 'Product or cart not found'})
+        return self.instance
 
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
@@ -114,6 +264,12 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['quantity']
 
+    def update(self, instance, validated_data):
+        try:
+            return get_cart_storage().set_quantity(instance, validated_data['quantity'])
+        except ObjectDoesNotExist:
+            raise NotFound('Cart item not found')
+
 
 class CartSerializer(serializers.ModelSerializer):
     class Meta:
@@ -122,14 +278,13 @@ class CartSerializer(serializers.ModelSerializer):
 
     id = serializers.CharField(read_only=True)
     cartitem_set = CartItemSerializer(CartItem.objects.all(), many=True, read_only=True)
-    cart_total_price = serializers.SerializerMethodField(
-        read_only=True,
-        method_name='cart_total_price_method'
+    cart_total_price = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        source='total_price',
+        read_only=True
     )
 
-    def cart_total_price_method(self, cart: Cart):
-        return Decimal(sum(cartitem.product.unit_price * cartitem.quantity for cartitem in cart.cartitem_set.all()))
-
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -157,7 +312,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     )
 
     def get_order_item_total_price(self, orderitem: OrderItem):
-        return Decimal(orderitem.product.unit_price * orderitem.quantity)
+        return orderitem.unit_price * orderitem.quantity
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -169,34 +324,13 @@ class OrderSerializer(serializers.ModelSerializer):
     paymentstatus = serializers.CharField(read_only=True)
     customer_id = serializers.IntegerField(read_only=True)
     orderitem_set = OrderItemSerializer(OrderItem.objects.all(), many=True, read_only=True)
-    order_total_price = serializers.SerializerMethodField(
-        read_only=True,
-        method_name='get_order_total_price'
+    order_total_price = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        source='total_amount',
+        read_only=True
     )
 
-    def get_order_total_price(self, order: Order):
-        return Decimal(sum((orderitem.product.unit_price * orderitem.quantity) for orderitem in order.orderitem_set.all()))
-    
-    def save(self, **kwargs):
-        with transaction.atomic():
-            order = super().save(**kwargs)
-            if self.context['request'].method == 'POST':
-                cartitem_set = CartItem.objects.select_related('product').filter(cart_id=self.context['cart_id'])
-                orderitem_set = [
-                    OrderItem(
-                        order=order,
-                        product=item.product,
-                        unit_price=item.product.unit_price,
-                        quantity=item.quantity
-                    ) for item in cartitem_set
-                ]
-                OrderItem.objects.bulk_create(orderitem_set)
-                order_created.send_robust(sender=self.__class__, order=order.id)
-                # Cart.objects.filter(pk=self.context['cart_id']).delete()
-            else:
-                pass
-            return order
-        
 
 class CreateOrderSerializer(OrderSerializer):
     class Meta(OrderSerializer.Meta):
@@ -204,6 +338,52 @@ class CreateOrderSerializer(OrderSerializer):
 
     cart_id = serializers.UUIDField()
 
+    def create(self, validated_data):
+        """
+        Turn the cart into an order in a fixed number of queries, whatever the cart size:
+        lock the cart, read its lines, insert the order, reserve inventory for it (see
+        `store.inventory.reserve`) and bulk insert its items. The order is returned with its items prefetched
+        from memory.
+        """
+        cart_id = validated_data['cart_id']
+        cart_storage = get_cart_storage()
+        with transaction.atomic():
+            cart_storage.flush(cart_id)
+            # locked until the order is committed, store.tasks.delete_stale_carts skips it meanwhile
+            if not list(Cart.objects.select_for_update().filter(pk=cart_id).values_list('pk', flat=True)):
+                raise CheckoutError('Cart id not found')
+            lines = list(
+                CartItem.objects.filter(cart_id=cart_id)
+                .values_list('product_id', 'quantity', 'product__unit_price', 'product__collection_id')
+            )
+            if not lines:
+                raise CheckoutError('Empty cart')
+
+            order = Order.objects.create(
+                customer_id=validated_data['customer_id'],
+                total_amount=sum(unit_price * quantity for _, quantity, unit_price, _ in lines),
+                item_count=len(lines)
+            )
+            quantities = {product_id: quantity for product_id, quantity, *_ in lines}
+            inventory.reserve(order, quantities)
+            orderitem_set = OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product_id=product_id,
+                    unit_price=unit_price,
+                    quantity=quantity
+                ) for product_id, quantity, unit_price, collection_id in lines
+            ])
+            prefetch_from_memory(order, 'orderitem_set', orderitem_set)
+
+            collection_ids = {collection_id for *_, collection_id in lines}
+            transaction.on_commit(lambda: caching.bump_products(quantities, collection_ids))
+            transaction.on_commit(lambda: cart_storage.discard(cart_id))
+            # receivers run after commit, see store.events
+            events.record(order.id, OrderEvent.KIND_CREATED)
+            # Cart.objects.filter(pk=self.context['cart_id']).delete()
+        return order
+
 
 class UpdateOrderSerializer(OrderSerializer):
     paymentstatus = serializers.CharField(read_only=False)
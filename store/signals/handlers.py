@@ -1,6 +1,9 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from store.models import Customer
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from store import caching, customers, images, inventory, nested
+from store.tasks import enqueue, generate_image_variants
+from store.models import Collection, Customer, Order, OrderItem, Product, ProductImage, Promotion, Review, ReviewSummary, TaxRate
 from django.conf import settings
 
 
@@ -8,3 +11,141 @@ from django.conf import settings
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=kwargs['instance'])
+
+
+@receiver(signal=post_save, sender=Customer)
+@receiver(signal=post_delete, sender=Customer)
+def forget_customer(sender, instance, **kwargs):
+    transaction.on_commit(lambda: customers.forget_profile(instance.user_id))
+
+
+# Response cache invalidation. Bumps run on commit, so a concurrent reader can never
+# cache pre-commit data under the new version.
+@receiver(signal=post_save, sender=Product)
+@receiver(signal=post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    collection_ids = {instance.collection_id, getattr(instance, '_loaded_collection_id', None)}
+    transaction.on_commit(lambda: caching.bump_products([instance.pk], collection_ids))
+
+
+# Collection.product_count upkeep, after invalidate_product which reads the loaded collection
+@receiver(signal=post_save, sender=Product)
+def count_saved_product(sender, instance, created, **kwargs):
+    loaded_collection_id = getattr(instance, '_loaded_collection_id', None)
+    if created:
+        Collection.objects.add_products(instance.collection_id, 1)
+    elif loaded_collection_id is not None and loaded_collection_id != instance.collection_id:
+        Collection.objects.add_products(loaded_collection_id, -1)
+        Collection.objects.add_products(instance.collection_id, 1)
+    instance._loaded_collection_id = instance.collection_id
+
+
+@receiver(signal=post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    Collection.objects.add_products(instance.collection_id, -1)
+
+
+# Customer.orders_count upkeep
+@receiver(signal=post_save, sender=Order)
+def count_saved_order(sender, instance, created, **kwargs):
+    loaded_customer_id = getattr(instance, '_loaded_customer_id', None)
+    if created:
+        Customer.objects.add_orders(instance.customer_id, 1)
+    elif loaded_customer_id is not None and loaded_customer_id != instance.customer_id:
+        Customer.objects.add_orders(loaded_customer_id, -1)
+        Customer.objects.add_orders(instance.customer_id, 1)
+    instance._loaded_customer_id = instance.customer_id
+
+
+@receiver(signal=post_delete, sender=Order)
+def count_deleted_order(sender, instance, **kwargs):
+    Customer.objects.add_orders(instance.customer_id, -1)
+
+
+@receiver(signal=post_delete, sender=Product)
+def forget_deleted_product(sender, instance, **kwargs):
+    nested.forget_product(instance.pk)
+
+
+@receiver(signal=post_save, sender=ProductImage)
+@receiver(signal=post_delete, sender=ProductImage)
+@receiver(signal=post_save, sender=Review)
+@receiver(signal=post_delete, sender=Review)
+def invalidate_parent_product(sender, instance, **kwargs):
+    collection_ids = Product.objects.filter(pk=instance.product_id).values_list('collection_id', flat=True)
+    collection_ids = list(collection_ids)
+    transaction.on_commit(lambda: caching.bump_products([instance.product_id], collection_ids))
+
+
+@receiver(signal=post_save, sender=Collection)
+@receiver(signal=post_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    transaction.on_commit(lambda: caching.bump_products(collection_ids=[instance.pk]))
+
+
+@receiver(signal=post_save, sender=Promotion)
+@receiver(signal=post_delete, sender=Promotion)
+@receiver(signal=post_save, sender=TaxRate)
+@receiver(signal=post_delete, sender=TaxRate)
+def invalidate_all(sender, instance, **kwargs):
+    transaction.on_commit(caching.bump_global)
+
+
+@receiver(signal=m2m_changed, sender=Product.promotions.through)
+def invalidate_product_promotions(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        transaction.on_commit(caching.bump_global)
+    else:
+        transaction.on_commit(lambda: caching.bump_products([instance.pk], [instance.collection_id]))
+
+
+@receiver(signal=post_save, sender=Order)
+def settle_inventory_reservations(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_loaded_paymentstatus', None) != Order.STATUS_P:
+        return
+    if instance.paymentstatus == Order.STATUS_F:
+        inventory.release([instance.pk])
+    elif instance.paymentstatus == Order.STATUS_C:
+        inventory.commit([instance.pk])
+    instance._loaded_paymentstatus = instance.paymentstatus
+
+
+@receiver(signal=pre_delete, sender=Order)
+def release_inventory_reservations(sender, instance, **kwargs):
+    inventory.release([instance.pk])
+
+
+@receiver(signal=post_save, sender=OrderItem)
+@receiver(signal=post_delete, sender=OrderItem)
+def refresh_order_totals(sender, instance, **kwargs):
+    Order.objects.filter(pk=instance.order_id).refresh_totals()
+
+
+@receiver(signal=post_save, sender=Review)
+def add_review_to_summary(sender, instance, created, **kwargs):
+    if created:
+        ReviewSummary.objects.add(instance)
+    else:
+        ReviewSummary.objects.change(instance)
+
+
+@receiver(signal=post_delete, sender=Review)
+def remove_review_from_summary(sender, instance, **kwargs):
+    ReviewSummary.objects.remove(instance)
+
+
+@receiver(signal=post_save, sender=ProductImage)
+def schedule_image_variants(sender, instance, created, **kwargs):
+    if not created and instance.image.name == getattr(instance, '_loaded_image', None):
+        return
+    instance._loaded_image = instance.image.name
+    # the upload is committed whatever the broker says, generate_missing_image_variants catches up
+    transaction.on_commit(lambda: enqueue(generate_image_variants, instance.pk))
+
+
+@receiver(signal=post_delete, sender=ProductImage)
+def delete_image_variants(sender, instance, **kwargs):
+    storage, variants = instance.image.storage, instance.variants
+    transaction.on_commit(lambda: images.delete_variants(storage, variants))
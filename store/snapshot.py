@@ -0,0 +1,247 @@
+"""
+Binary catalog snapshots, for clients that need the whole catalog rather than pages of
+`/store/products/`.
+
+A snapshot is a little header followed by columns: fixed width arrays (ids, prices in
+cents, inventory, string indexes) and one string table holding every text value once.
+Columns are 8 byte aligned, so `CatalogSnapshot` can map the file and hand out
+`memoryview`s of it without copying or parsing rows.
+
+Layout, in native byte order (recorded in the header):
+
+    magic           8s      b'STORESNP'
+    version         I
+    byteorder       1s      b'<' or b'>'
+    section count   I
+    sections        32s 4s Q Q per section: name, array typecode, offset, item count
+    ... column data
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from store import tax
+from store.models import Collection, Product, ProductImage, Promotion
+from store.serializers import ProductSerializer
+
+
+MAGIC = b'STORESNP'
+VERSION = 1
+HEADER = struct.Struct('=8sIcI')
+SECTION = struct.Struct('=32s4sQQ')
+ALIGNMENT = 8
+BYTEORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+# string index of a NULL text value
+NULL = 0xFFFFFFFF
+# prices are stored as integers of 1/PRICE_SCALE
+PRICE_SCALE = 100
+
+# ProductSerializer fields and the columns they are exported to. Fields missing here
+# must be listed in SKIPPED_FIELDS, see test_snapshot.
+PRODUCT_COLUMNS = {
+    'id': ('products.id', 'q'),
+    'title': ('products.title', 'I'),
+    'description': ('products.description', 'I'),
+    'slug': ('products.slug', 'I'),
+    'unit_price': ('products.unit_price', 'q'),
+    'inventory': ('products.inventory', 'q'),
+    # an id instead of the hyperlink, see the collections.* columns
+    'collection': ('products.collection', 'q'),
+    'price_with_tax': ('products.price_with_tax', 'q'),
+    # rows of the images.* columns
+    'productimage_set': ('images.product', 'q'),
+}
+# expansions are per request, they aren't part of the snapshot
+SKIPPED_FIELDS = set(ProductSerializer.Meta.expandable_fields)
+
+OTHER_COLUMNS = {
+    'images.id': 'q',
+    'images.url': 'I',
+    'collections.id': 'q',
+    'collections.title': 'I',
+    'collections.product_count': 'q',
+    'promotions.id': 'q',
+    'promotions.description': 'I',
+    'promotions.discount': 'd',
+    'product_promotions.product': 'q',
+    'product_promotions.promotion': 'q',
+    'strings.offsets': 'Q',
+    'strings.data': 'B',
+    'meta': 'B',
+}
+
+
+def get_path():
+    return settings.STORE_SNAPSHOT_PATH
+
+
+def to_cents(value):
+    return int((Decimal(value) * PRICE_SCALE).to_integral_value())
+
+
+class StringTable:
+    """Interns strings, each distinct value is stored once."""
+    def __init__(self):
+        self.indexes = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def add(self, value):
+        if value is None:
+            return NULL
+        index = self.indexes.get(value)
+        if index is None:
+            index = self.indexes[value] = len(self.offsets) - 1
+            self.data += value.encode()
+            self.offsets.append(len(self.data))
+        return index
+
+
+def export(path=None, region=None, chunk_size=2000):
+    """Write a snapshot of the catalog to `path`, atomically replacing the previous one."""
+    path = path or get_path()
+    region = region or settings.STORE_TAX_REGION
+    strings = StringTable()
+    columns = {name: array(typecode) for name, typecode in PRODUCT_COLUMNS.values()}
+    columns.update((name, array(typecode)) for name, typecode in OTHER_COLUMNS.items())
+
+    def append(name, value):
+        columns[name].append(value)
+
+    # one transaction, so the tables are read at the same point in time (InnoDB repeatable read)
+    with transaction.atomic():
+        products = tax.annotate_price_with_tax(Product.objects.order_by('id'), region).values_list(
+            'id', 'title', 'description', 'slug', 'unit_price', 'inventory', 'collection_id', 'price_with_tax'
+        )
+        for pk, title, description, slug, unit_price, inventory, collection_id, price_with_tax in products.iterator(chunk_size=chunk_size):
+            append('products.id', pk)
+            append('products.title', strings.add(title))
+            append('products.description', strings.add(description))
+            append('products.slug', strings.add(slug))
+            append('products.unit_price', to_cents(unit_price))
+            append('products.inventory', inventory)
+            append('products.collection', collection_id)
+            append('products.price_with_tax', to_cents(price_with_tax))
+
+        image_storage = ProductImage._meta.get_field('image').storage
+        images = ProductImage.objects.order_by('product_id', 'id').values_list('product_id', 'id', 'image')
+        for product_id, pk, name in images.iterator(chunk_size=chunk_size):
+            append('images.product', product_id)
+            append('images.id', pk)
+            append('images.url', strings.add(image_storage.url(name)))
+
+        for pk, title, product_count in Collection.objects.order_by('id').values_list('id', 'title', 'product_count'):
+            append('collections.id', pk)
+            append('collections.title', strings.add(title))
+            append('collections.product_count', product_count)
+
+        for pk, description, discount in Promotion.objects.order_by('id').values_list('id', 'description', 'discount'):
+            append('promotions.id', pk)
+            append('promotions.description', strings.add(description))
+            append('promotions.discount', discount)
+
+        links = Product.promotions.through.objects.order_by('product_id', 'promotion_id').values_list('product_id', 'promotion_id')
+        for product_id, promotion_id in links.iterator(chunk_size=chunk_size):
+            append('product_promotions.product', product_id)
+            append('product_promotions.promotion', promotion_id)
+
+    columns['strings.offsets'] = strings.offsets
+    columns['strings.data'] = array('B', strings.data)
+    meta = {
+        'created_at': timezone.now().isoformat(),
+        'region': region,
+        'price_scale': PRICE_SCALE,
+        'fields': list(PRODUCT_COLUMNS),
+    }
+    columns['meta'] = array('B', json.dumps(meta).encode())
+
+    write(path, columns)
+    return {'products': len(columns['products.id']), 'strings': len(strings.offsets) - 1, 'bytes': os.path.getsize(path)}
+
+
+def align(position):
+    return -position % ALIGNMENT
+
+
+def write(path, columns):
+    position = HEADER.size + SECTION.size * len(columns)
+    sections = []
+    for name, values in columns.items():
+        position += align(position)
+        sections.append(SECTION.pack(name.encode(), values.typecode.encode(), position, len(values)))
+        position += len(values) * values.itemsize
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, BYTEORDER, len(columns)))
+        for section in sections:
+            file.write(section)
+        for values in columns.values():
+            file.write(b'\0' * align(file.tell()))
+            values.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    # readers holding the previous file keep their mapping
+    os.replace(temporary, path)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class CatalogSnapshot:
+    """
+    Memory mapped snapshot. `column(name)` returns a read only memoryview over the file,
+    `string(index)` decodes a single value of the string table. Views handed out must be
+    released before `close()`.
+    """
+    def __init__(self, path=None):
+        with open(path or get_path(), 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        magic, version, byteorder, count = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError('Not a catalog snapshot, or an unsupported version')
+        if byteorder != BYTEORDER:
+            raise SnapshotError('Snapshot written on a machine of another byte order')
+        self.sections = {}
+        for index in range(count):
+            name, typecode, offset, length = SECTION.unpack_from(self.buffer, HEADER.size + index * SECTION.size)
+            self.sections[name.rstrip(b'\0').decode()] = (typecode.rstrip(b'\0').decode(), offset, length)
+        self.string_offsets = self.column('strings.offsets')
+        self.string_data = self.column('strings.data')
+        with self.column('meta') as meta:
+            self.meta = json.loads(bytes(meta))
+
+    def close(self):
+        self.string_offsets.release()
+        self.string_data.release()
+        self.buffer.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def column(self, name):
+        typecode, offset, length = self.sections[name]
+        itemsize = array(typecode).itemsize
+        return self.buffer[offset:offset + length * itemsize].cast(typecode)
+
+    def string(self, index):
+        if index == NULL:
+            return None
+        return bytes(self.string_data[self.string_offsets[index]:self.string_offsets[index + 1]]).decode()
+
+    def __len__(self):
+        return self.sections['products.id'][2]
@@ -0,0 +1,138 @@
+import logging
+from datetime import timedelta
+from time import perf_counter
+from celery import shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from kombu.exceptions import KombuError
+from PIL import Image
+from store import caching, events, images, inventory
+from store.models import Cart, CartItem, ProductImage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args, **kwargs):
+    """
+    Queue `task`, logging instead of raising when the broker can't be reached. For tasks
+    queued after a commit the request must not fail on, and that a periodic task catches up.
+    """
+    try:
+        task.delay(*args, **kwargs)
+    except (KombuError, OSError):
+        logger.exception('Could not queue %s', task.name)
+        return False
+    return True
+
+
+@shared_task
+def delete_stale_carts(max_age=None, batch_size=None):
+    """
+    Delete carts created more than `max_age` seconds ago, `batch_size` carts per short
+    transaction. Carts locked by a running checkout (see `CreateOrderSerializer.create`)
+    are skipped where the database supports SKIP LOCKED, and picked up by a later run.
+    """
+    max_age = max_age if max_age is not None else settings.STORE_CART_MAX_AGE
+    batch_size = batch_size or settings.STORE_CART_GC_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    deleted_carts = deleted_items = 0
+    start = perf_counter()
+
+    while True:
+        with transaction.atomic():
+            batch = Cart.objects.filter(created_at__lt=cutoff).order_by('created_at')
+            if connection.features.has_select_for_update_skip_locked:
+                batch = batch.select_for_update(skip_locked=True)
+            cart_ids = list(batch.values_list('id', flat=True)[:batch_size])
+            if not cart_ids:
+                break
+            deleted_items += CartItem.objects.filter(cart_id__in=cart_ids).delete()[0]
+            deleted_carts += Cart.objects.filter(pk__in=cart_ids).delete()[0]
+
+    elapsed = perf_counter() - start
+    rows_per_second = (deleted_carts + deleted_items) / elapsed if elapsed else 0
+    logger.info(
+        'Deleted %d stale carts and %d cart items in %.2fs (%.0f rows/s)',
+        deleted_carts, deleted_items, elapsed, rows_per_second
+    )
+    return {
+        'carts': deleted_carts,
+        'items': deleted_items,
+        'seconds': elapsed,
+        'rows_per_second': rows_per_second,
+    }
+
+
+@shared_task
+def release_expired_reservations():
+    """Fail pending orders whose inventory reservation expired and put their stock back."""
+    released = inventory.release_expired()
+    logger.info('Released %d expired inventory reservations', released)
+    return released
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def generate_image_variants(image_id):
+    """Make the WebP variants of a product image and record them on it."""
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not product_image.image:
+        return None
+    storage = product_image.image.storage
+    variants = images.make_variants(product_image.image)
+    # the image may have been replaced or deleted while the variants were made
+    updated = ProductImage.objects.filter(pk=image_id, image=product_image.image.name).update(variants=variants, variants_error='')
+    if not updated:
+        images.delete_variants(storage, variants)
+        return None
+    images.delete_variants(storage, product_image.variants)
+    caching.bump_products([product_image.product_id], [product_image.product.collection_id])
+    return variants
+
+
+@shared_task(bind=True, max_retries=None)
+def dispatch_order_events(self, batch_size=None):
+    """
+    Send pending order events to their receivers, batch after batch. When events failed,
+    the task runs again once the first of them is due (see `events.retry_delay`); the beat
+    schedule also runs this task, for events whose after-commit dispatch was lost.
+    """
+    batch_size = batch_size or settings.STORE_ORDER_EVENT_BATCH_SIZE
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = events.dispatch(batch_size)
+        total_sent += sent
+        total_failed += failed
+        # failed events wait for their retry, they aren't claimed again by this loop
+        if sent + failed < batch_size:
+            break
+    logger.info('Dispatched %d order events, %d failed', total_sent, total_failed)
+    retry_at = events.next_retry_at() if total_failed else None
+    if retry_at is not None:
+        raise self.retry(eta=retry_at)
+    return {'sent': total_sent, 'failed': total_failed}
+
+
+@shared_task
+def generate_missing_image_variants(batch_size=None):
+    """
+    Make the variants of up to `batch_size` images that have none, e.g. because their task
+    couldn't be queued while the broker was down. An image that fails is marked with the
+    error and left to the generate_image_variants command, so it can't stall every sweep.
+    """
+    batch_size = batch_size or settings.STORE_IMAGE_VARIANT_SWEEP_SIZE
+    image_ids = list(
+        ProductImage.objects.filter(variants={}, variants_error='').exclude(image='')
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    generated = 0
+    for image_id in image_ids:
+        try:
+            if generate_image_variants(image_id) is not None:
+                generated += 1
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            # missing, truncated or undecodable file
+            logger.exception('Could not make the variants of product image %d', image_id)
+            ProductImage.objects.filter(pk=image_id).update(variants_error=repr(error))
+    logger.info('Made the variants of %d of %d product images', generated, len(image_ids))
+    return generated
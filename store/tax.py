@@ -0,0 +1,51 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from store.models import TaxRate
+
+
+REGION_QUERY_PARAM = 'region'
+RATE_FIELD = DecimalField(max_digits=5, decimal_places=4)
+PRICE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def get_region(request=None):
+    if request is not None:
+        region = request.query_params.get(REGION_QUERY_PARAM)
+        if region:
+            return region
+    return settings.STORE_TAX_REGION
+
+
+def tax_rate_expression(region, collection_ref='collection_id'):
+    """Rate of the product's collection in `region`, else the region-wide rate, else the default."""
+    rates = TaxRate.objects.filter(region=region)
+    return Coalesce(
+        Subquery(rates.filter(collection_id=OuterRef(collection_ref)).values('rate')[:1]),
+        Subquery(rates.filter(collection__isnull=True).values('rate')[:1]),
+        Value(settings.STORE_DEFAULT_TAX_RATE),
+        output_field=RATE_FIELD
+    )
+
+
+def annotate_price_with_tax(queryset, region):
+    return queryset.annotate(price_with_tax=ExpressionWrapper(
+        F('unit_price') * (Value(Decimal(1)) + tax_rate_expression(region)),
+        output_field=PRICE_FIELD
+    ))
+
+
+def get_tax_rate(collection_id, region):
+    rates = {
+        rate.collection_id: rate.rate
+        for rate in TaxRate.objects.filter(
+            Q(collection_id=collection_id) | Q(collection__isnull=True), region=region
+        )
+    }
+    return rates.get(collection_id, rates.get(None, settings.STORE_DEFAULT_TAX_RATE))
+
+
+def price_with_tax(product, region):
+    """Python counterpart of `annotate_price_with_tax`, for products loaded without the annotation."""
+    return product.unit_price * (1 + get_tax_rate(product.collection_id, region))
@@ -1,5 +1,8 @@
 import pytest
+from django.core.cache import cache
 from rest_framework.test import APIClient
+from store import nested, search
+from store_core import authentication
 from store_core.models import User
 
 @pytest.fixture
@@ -10,4 +13,18 @@ def api_client():
 def authenticate_user(api_client):
     def perform_authenticate(is_staff=False):
         return api_client.force_authenticate(user=User(is_staff=is_staff))
-    return perform_authenticate
\ No newline at end of file
+    return perform_authenticate
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    cache.clear()
+    # the search index is versioned through the cache that was just emptied
+    search.reset_index()
+    nested.known_products.clear()
+    authentication.local_users.clear()
+    return cache
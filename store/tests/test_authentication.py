@@ -0,0 +1,72 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from store_core import authentication
+from store_core.models import User
+import pytest
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username='buyer', email='buyer@example.com', password='password', first_name='Ann')
+
+
+@pytest.fixture
+def jwt_client(api_client, user):
+    api_client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+    return api_client
+
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+    def get_me(self, client):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/store/orders/')
+        user_queries = [query for query in queries if 'store_core_user' in query['sql']]
+        return response, user_queries
+
+    def test_user_row_is_read_once(self, jwt_client):
+        response, user_queries = self.get_me(jwt_client)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(user_queries) == 1
+
+        response, user_queries = self.get_me(jwt_client)
+        assert response.status_code == status.HTTP_200_OK
+        assert user_queries == []
+
+    def test_redis_tier_serves_other_processes(self, jwt_client):
+        self.get_me(jwt_client)
+        authentication.local_users.clear()
+
+        response, user_queries = self.get_me(jwt_client)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert user_queries == []
+
+    def test_saving_user_invalidates_snapshot(self, jwt_client, user, django_capture_on_commit_callbacks):
+        self.get_me(jwt_client)
+        with django_capture_on_commit_callbacks(execute=True):
+            user.is_active = False
+            user.save()
+
+        response, _ = self.get_me(jwt_client)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_deleted_user_is_rejected(self, jwt_client, user, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            user.delete()
+
+        response, _ = self.get_me(jwt_client)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_cached_user_loads_row_for_other_attributes(self, user):
+        cached = authentication.CachedUser(authentication.load_snapshot(user.pk))
+
+        with CaptureQueriesContext(connection) as queries:
+            assert (cached.pk, cached.first_name, cached.is_authenticated) == (user.pk, 'Ann', True)
+        assert len(queries) == 0
+        assert cached.email == 'buyer@example.com'
+        assert cached.check_password('password')
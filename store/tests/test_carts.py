@@ -0,0 +1,150 @@
+from decimal import Decimal
+from datetime import timedelta
+from django.utils import timezone
+from store import carts
+from store.models import Cart, CartItem, Product
+from store_core.models import User
+from store.tasks import delete_stale_carts
+from rest_framework import status
+import django_redis
+import fakeredis
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def add_to_cart(api_client):
+    def perform_add(cart_id, item):
+        return api_client.post(f'/store/carts/{cart_id}/cartitems/', item, format='json')
+    return perform_add
+
+
+@pytest.mark.django_db
+class TestAddCartItem:
+    def test_if_item_is_new_returns_201_in_one_query(self, add_to_cart, django_assert_num_queries):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=10)
+
+        with django_assert_num_queries(1):
+            response = add_to_cart(cart.id, {'product_id': product.id, 'quantity': 3})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data == {'id': response.data['id'], 'product_id': product.id, 'quantity': 3}
+
+    def test_if_item_exists_quantities_add_up(self, add_to_cart):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=10)
+
+        first = add_to_cart(cart.id, {'product_id': product.id, 'quantity': 3})
+        second = add_to_cart(cart.id, {'product_id': product.id, 'quantity': 2})
+
+        assert second.data['id'] == first.data['id']
+        assert second.data['quantity'] == 5
+        assert CartItem.objects.get(pk=first.data['id']).quantity == 5
+
+
+@pytest.mark.django_db
+class TestRetrieveCart:
+    def test_totals_are_computed_in_two_queries(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product=baker.make(Product, unit_price=10), quantity=3)
+        baker.make(CartItem, cart=cart, product=baker.make(Product, unit_price='2.5'), quantity=2)
+
+        with django_assert_num_queries(2):
+            response = api_client.get(f'/store/carts/{cart.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['cart_item_total_price'] for item in response.data['cartitem_set']] == [Decimal('30.00'), Decimal('5.00')]
+        assert response.data['cart_total_price'] == Decimal('35.00')
+
+    def test_if_cart_is_empty_total_is_zero(self, api_client):
+        cart = baker.make(Cart)
+
+        response = api_client.get(f'/store/carts/{cart.id}/')
+
+        assert response.data['cartitem_set'] == []
+        assert response.data['cart_total_price'] == 0
+
+
+@pytest.mark.django_db
+class TestDeleteStaleCarts:
+    def test_deletes_old_carts_in_batches_and_keeps_recent_ones(self):
+        old_carts = baker.make(Cart, _quantity=3)
+        Cart.objects.filter(pk__in=[cart.id for cart in old_carts]).update(created_at=timezone.now() - timedelta(days=60))
+        baker.make(CartItem, cart=old_carts[0], product=baker.make(Product, unit_price=10), quantity=1)
+        recent_cart = baker.make(Cart)
+
+        result = delete_stale_carts(max_age=timedelta(days=30).total_seconds(), batch_size=2)
+
+        assert result['carts'] == 3
+        assert result['items'] == 1
+        assert list(Cart.objects.values_list('id', flat=True)) == [recent_cart.id]
+
+
+@pytest.fixture
+def redis_carts(settings, monkeypatch):
+    server = fakeredis.FakeRedis()
+    monkeypatch.setattr(django_redis, 'get_redis_connection', lambda alias='default': server)
+    settings.STORE_CART_STORAGE = 'store.carts.RedisCartStorage'
+    carts._load_storage.cache_clear()
+    yield server
+    carts._load_storage.cache_clear()
+
+
+@pytest.fixture
+def redis_cart(api_client, redis_carts):
+    return api_client.post('/store/carts/').data['id']
+
+
+@pytest.mark.django_db
+class TestRedisCartStorage:
+    def test_create_keeps_cart_out_of_database(self, redis_carts, redis_cart):
+        assert not Cart.objects.exists()
+        assert redis_carts.ttl(f'store:cart:{redis_cart}') > 0
+
+    def test_items_add_up_update_and_delete(self, api_client, add_to_cart, redis_cart):
+        product = baker.make(Product, unit_price=10)
+
+        add_to_cart(redis_cart, {'product_id': product.id, 'quantity': 3})
+        response = add_to_cart(redis_cart, {'product_id': product.id, 'quantity': 2})
+        assert response.data['quantity'] == 5
+
+        response = api_client.patch(f'/store/carts/{redis_cart}/cartitems/{product.id}/', {'quantity': 7}, format='json')
+        assert response.data['quantity'] == 7
+        response = api_client.get(f'/store/carts/{redis_cart}/')
+        assert response.data['cart_total_price'] == Decimal('70.00')
+
+        response = api_client.delete(f'/store/carts/{redis_cart}/cartitems/{product.id}/')
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert api_client.get(f'/store/carts/{redis_cart}/').data['cartitem_set'] == []
+        assert not CartItem.objects.exists()
+
+    def test_activity_refreshes_ttl(self, api_client, redis_carts, redis_cart, settings):
+        key = f'store:cart:{redis_cart}'
+        redis_carts.expire(key, 10)
+
+        api_client.get(f'/store/carts/{redis_cart}/')
+
+        assert redis_carts.ttl(key) > 10
+
+    def test_expired_cart_returns_404(self, api_client, add_to_cart, redis_carts, redis_cart):
+        redis_carts.delete(f'store:cart:{redis_cart}')
+        product = baker.make(Product, unit_price=10)
+
+        assert api_client.get(f'/store/carts/{redis_cart}/').status_code == status.HTTP_404_NOT_FOUND
+        assert add_to_cart(redis_cart, {'product_id': product.id, 'quantity': 1}).status_code == status.HTTP_400_BAD_REQUEST
+        assert not redis_carts.exists(f'store:cart:{redis_cart}')
+
+    def test_checkout_flushes_cart_to_database_and_discards_it(self, api_client, add_to_cart, redis_carts, redis_cart, django_capture_on_commit_callbacks):
+        products = baker.make(Product, unit_price=10, inventory=10, _quantity=2)
+        for product in products:
+            add_to_cart(redis_cart, {'product_id': product.id, 'quantity': 2})
+        api_client.force_authenticate(user=User.objects.create_user(username='buyer', email='buyer@example.com'))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post('/store/orders/', {'cart_id': redis_cart}, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['order_total_price'] == 40
+        assert sorted(CartItem.objects.filter(cart_id=redis_cart).values_list('product_id', 'quantity')) == [(product.id, 2) for product in products]
+        assert not redis_carts.exists(f'store:cart:{redis_cart}')
@@ -1,4 +1,6 @@
-from store.models import Collection
+from io import StringIO
+from django.core.management import call_command
+from store.models import Collection, Product
 from rest_framework.test import APIClient
 from rest_framework import status
 from store_core.models import User
@@ -75,4 +77,40 @@ class TestRetrieveCollection:
     def test_if_collection_not_exists_return_404(self, get_collection):
         response = get_collection(0)
 
-        assert response.status_code == status.HTTP_404_NOT_FOUND
\ No newline at end of file
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.django_db
+class TestCollectionProductCount:
+    def test_count_follows_product_create_move_and_delete(self):
+        first, second = baker.make(Collection, _quantity=2)
+        products = baker.make(Product, collection=first, unit_price=10, _quantity=3)
+
+        moved = Product.objects.get(pk=products[0].pk)
+        moved.collection = second
+        moved.save()
+        products[1].delete()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert (first.product_count, second.product_count) == (1, 1)
+
+    def test_saving_a_collection_keeps_products_added_since_it_was_loaded(self):
+        collection = baker.make(Collection)
+        stale = Collection.objects.get(pk=collection.pk)
+        baker.make(Product, collection=collection, unit_price=10)
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        collection.refresh_from_db()
+        assert (collection.title, collection.product_count) == ('Renamed', 1)
+
+    def test_recount_repairs_drift(self):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=10, _quantity=2)
+        Collection.objects.filter(pk=collection.pk).update(product_count=7)
+
+        call_command('recount_collections', stdout=StringIO())
+
+        collection.refresh_from_db()
+        assert collection.product_count == 2
@@ -0,0 +1,129 @@
+import itertools
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from store.models import Customer, Order
+from store_core.models import User
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+
+
+@pytest.fixture
+def customer_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.mark.django_db
+class TestCustomerMe:
+    def test_profile_is_served_from_cache(self, customer_client, user):
+        response = customer_client.get('/store/customers/me/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == user.customer.id
+
+        with CaptureQueriesContext(connection) as queries:
+            response = customer_client.get('/store/customers/me/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(queries) == 0
+
+    def test_missing_customer_is_created(self, customer_client, user):
+        Customer.objects.filter(user=user).delete()
+
+        response = customer_client.get('/store/customers/me/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert Customer.objects.get(user=user).id == response.data['id']
+
+    def test_put_updates_with_single_query(self, customer_client, user, django_capture_on_commit_callbacks):
+        customer_client.get('/store/customers/me/')
+
+        with CaptureQueriesContext(connection) as queries:
+            with django_capture_on_commit_callbacks(execute=True):
+                response = customer_client.put('/store/customers/me/', {'phone': '555', 'birth_date': '1990-01-02'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert (response.data['phone'], response.data['birth_date']) == ('555', '1990-01-02')
+        assert [query['sql'].split()[0] for query in queries] == ['UPDATE']
+        assert customer_client.get('/store/customers/me/').data['phone'] == '555'
+
+    def test_admin_changes_invalidate_profile(self, customer_client, user, django_capture_on_commit_callbacks):
+        customer_client.get('/store/customers/me/')
+        with django_capture_on_commit_callbacks(execute=True):
+            customer = Customer.objects.get(user=user)
+            customer.membership = Customer.MEMBER_SHIP_G
+            customer.save()
+
+        response = customer_client.get('/store/customers/me/')
+
+        assert response.data['membership'] == Customer.MEMBER_SHIP_G
+
+
+@pytest.fixture
+def make_customers():
+    indexes = itertools.count()
+    def perform_make(count):
+        for index in itertools.islice(indexes, count):
+            user = User.objects.create_user(username=f'user{index}', email=f'user{index}@example.com', first_name=f'Name {index}')
+            baker.make(Order, customer=user.customer, _quantity=2)
+    return perform_make
+
+
+@pytest.mark.django_db
+class TestListCustomers:
+    def test_query_count_does_not_depend_on_customer_count(self, api_client, authenticate_user, make_customers, django_assert_num_queries):
+        authenticate_user(is_staff=True)
+        make_customers(2)
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/customers/')
+        assert len(response.data) == 2
+
+        make_customers(5)
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/customers/')
+        assert len(response.data) == 5 + 2
+
+    def test_admin_changelist_query_count_does_not_depend_on_customer_count(self, client, make_customers, django_assert_max_num_queries):
+        client.force_login(User.objects.create_superuser(username='admin', email='admin@example.com', password='password'))
+        make_customers(2)
+        with django_assert_max_num_queries(10) as few:
+            response = client.get('/admin/store/customer/')
+        assert response.status_code == status.HTTP_200_OK
+
+        make_customers(10)
+        with django_assert_max_num_queries(10) as many:
+            response = client.get('/admin/store/customer/')
+
+        assert len(many.captured_queries) == len(few.captured_queries)
+        assert 'Name 11' in response.content.decode()
+        assert Customer.objects.get(user__username='user11').orders_count == 2
+
+
+@pytest.mark.django_db
+class TestOrdersCount:
+    def test_moving_an_order_moves_its_count(self):
+        first, second = (baker.make(User).customer for _ in range(2))
+        order = baker.make(Order, customer=first)
+
+        order = Order.objects.get(pk=order.pk)
+        order.customer = second
+        order.save()
+        order.save()
+
+        assert [Customer.objects.get(pk=customer.pk).orders_count for customer in (first, second)] == [0, 1]
+
+    def test_saving_a_customer_keeps_orders_placed_since_it_was_loaded(self):
+        customer = baker.make(User).customer
+        customer = Customer.objects.get(pk=customer.pk)
+        baker.make(Order, customer=customer)
+
+        customer.phone = '555'
+        customer.save()
+
+        customer = Customer.objects.get(pk=customer.pk)
+        assert (customer.phone, customer.orders_count) == ('555', 1)
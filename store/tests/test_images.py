@@ -0,0 +1,129 @@
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from kombu.exceptions import OperationalError
+from PIL import Image
+from store import tasks
+from store.models import Product, ProductImage
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+def make_upload(name, size=(1200, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+
+
+@pytest.mark.django_db
+class TestUploadImages:
+    def test_several_files_are_uploaded_and_get_webp_variants(self, api_client, authenticate_user, django_capture_on_commit_callbacks):
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(
+                f'/store/products/{product.id}/images/',
+                {'images': [make_upload('a.png'), make_upload('b.png')]},
+                format='multipart'
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data) == 2
+        image = ProductImage.objects.order_by('id').first()
+        assert set(image.variants) == {'thumbnail', 'medium'}
+        with image.image.storage.open(image.variants['thumbnail']) as file, Image.open(file) as thumbnail:
+            assert thumbnail.format == 'WEBP'
+            assert thumbnail.size == (200, 100)
+
+        listed = api_client.get(f'/store/products/{product.id}/images/')
+        assert listed.data[0]['variants']['medium'].endswith('.medium.webp')
+
+    def test_if_a_file_is_not_an_image_nothing_is_created(self, api_client, authenticate_user):
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post(
+            f'/store/products/{product.id}/images/',
+            {'images': [make_upload('a.png'), SimpleUploadedFile('b.png', b'not an image')]},
+            format='multipart'
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert list(response.data['images']) == [1]
+        assert not ProductImage.objects.exists()
+
+    def test_single_file_returns_an_object(self, api_client, authenticate_user):
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post(f'/store/products/{product.id}/images/', {'image': make_upload('a.png')}, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['id'] == ProductImage.objects.get().id
+
+    def test_multi_file_form_returns_a_list_for_one_file(self, api_client, authenticate_user):
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post(f'/store/products/{product.id}/images/', {'images': [make_upload('a.png')]}, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [image['id'] for image in response.data] == [ProductImage.objects.get().id]
+
+    def test_repeated_image_field_returns_400(self, api_client, authenticate_user):
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post(
+            f'/store/products/{product.id}/images/',
+            {'image': [make_upload('a.png'), make_upload('b.png')]},
+            format='multipart'
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not ProductImage.objects.exists()
+
+    def test_if_broker_is_down_upload_succeeds_and_sweep_makes_variants(self, api_client, authenticate_user, monkeypatch, django_capture_on_commit_callbacks):
+        def refuse(*args, **kwargs):
+            raise OperationalError('Error 111 connecting to localhost:6379. Connection refused.')
+        monkeypatch.setattr(tasks.generate_image_variants, 'delay', refuse)
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        authenticate_user(is_staff=True)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(f'/store/products/{product.id}/images/', {'image': make_upload('a.png')}, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert ProductImage.objects.get().variants == {}
+
+        assert tasks.generate_missing_image_variants() == 1
+        assert set(ProductImage.objects.get().variants) == {'thumbnail', 'medium'}
+
+    @pytest.mark.parametrize('content, max_pixels', [
+        (b'not an image', Image.MAX_IMAGE_PIXELS),
+        (make_upload('bomb.png').read(), 1000),
+    ], ids=['undecodable', 'decompression bomb'])
+    def test_sweep_records_images_it_cannot_decode_and_skips_them(self, monkeypatch, content, max_pixels):
+        monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', max_pixels)
+        product = baker.make(Product, title='Shoe', unit_price=10)
+        broken = ProductImage.objects.create(product=product, image=default_storage.save('store/broken.png', ContentFile(content)))
+        ProductImage.objects.create(product=product, image=default_storage.save('store/a.png', make_upload('a.png', size=(20, 20))))
+
+        assert tasks.generate_missing_image_variants() == 1
+        broken.refresh_from_db()
+        assert broken.variants == {}
+        assert broken.variants_error
+
+        made = []
+        monkeypatch.setattr(tasks.images, 'make_variants', made.append)
+        assert tasks.generate_missing_image_variants() == 0
+        assert made == []
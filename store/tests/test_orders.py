@@ -0,0 +1,387 @@
+import csv
+import json
+import threading
+from io import StringIO
+import time
+from uuid import uuid4
+from datetime import timedelta
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError as KombuOperationalError
+from store import events, inventory, tasks
+from store.exceptions import InsufficientInventory
+from store.models import Cart, CartItem, InventoryReservation, Order, OrderEvent, OrderItem, Product
+from store.signals import order_created
+from store_core.models import User
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def customer_client(api_client):
+    user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def make_cart():
+    def perform_make(item_count, inventory=10, quantity=2):
+        cart = baker.make(Cart)
+        for product in baker.make(Product, unit_price=10, inventory=inventory, _quantity=item_count):
+            baker.make(CartItem, cart=cart, product=product, quantity=quantity)
+        return cart
+    return perform_make
+
+
+@pytest.fixture
+def place_order(customer_client):
+    def perform_place(cart_id):
+        return customer_client.post('/store/orders/', {'cart_id': str(cart_id)}, format='json')
+    return perform_place
+
+
+@pytest.mark.django_db
+class TestPlaceOrder:
+    def test_query_count_does_not_depend_on_cart_size(self, make_cart, place_order, django_assert_max_num_queries):
+        small_cart, large_cart = make_cart(item_count=1), make_cart(item_count=20)
+
+        with django_assert_max_num_queries(11) as small:
+            place_order(small_cart.id)
+        with django_assert_max_num_queries(11) as large:
+            response = place_order(large_cart.id)
+
+        assert len(large.captured_queries) == len(small.captured_queries)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data['orderitem_set']) == 20
+        assert response.data['order_total_price'] == 400
+
+    def test_counts_orders_of_customer(self, make_cart, place_order):
+        place_order(make_cart(item_count=1).id)
+        place_order(make_cart(item_count=1).id)
+
+        assert User.objects.get(username='buyer').customer.orders_count == 2
+
+    def test_decrements_inventory(self, make_cart, place_order):
+        cart = make_cart(item_count=2, inventory=5, quantity=2)
+
+        place_order(cart.id)
+
+        assert list(Product.objects.values_list('inventory', flat=True)) == [3, 3]
+
+    def test_if_inventory_is_insufficient_returns_400_and_changes_nothing(self, make_cart, place_order):
+        cart = make_cart(item_count=2, inventory=1, quantity=2)
+
+        response = place_order(cart.id)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {'error': 'Not enough inventory'}
+        assert not Order.objects.exists()
+        assert list(Product.objects.values_list('inventory', flat=True)) == [1, 1]
+
+    def test_if_cart_is_empty_returns_400(self, place_order):
+        response = place_order(baker.make(Cart).id)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {'error': 'Empty cart'}
+
+    def test_if_cart_does_not_exist_returns_400(self, place_order):
+        response = place_order(uuid4())
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {'error': 'Cart id not found'}
+
+    def test_cart_is_locked_until_the_order_is_committed(self, make_cart, place_order, django_assert_max_num_queries):
+        if not connection.features.has_select_for_update:
+            pytest.skip('the database has no row locks')
+        with django_assert_max_num_queries(11) as queries:
+            place_order(make_cart(item_count=1).id)
+
+        assert any('store_cart' in query['sql'] and 'FOR UPDATE' in query['sql'] for query in queries.captured_queries)
+
+
+@pytest.mark.django_db
+class TestInventoryReservation:
+    def test_if_payment_fails_inventory_is_released(self, make_cart, place_order):
+        cart = make_cart(item_count=1, inventory=5, quantity=2)
+        order = Order.objects.get(pk=place_order(cart.id).data['id'])
+
+        order.paymentstatus = Order.STATUS_F
+        order.save()
+
+        assert Product.objects.get().inventory == 5
+        assert not InventoryReservation.objects.exists()
+
+    def test_if_payment_succeeds_inventory_stays_sold(self, make_cart, place_order):
+        cart = make_cart(item_count=1, inventory=5, quantity=2)
+        order = Order.objects.get(pk=place_order(cart.id).data['id'])
+
+        order.paymentstatus = Order.STATUS_C
+        order.save()
+
+        assert Product.objects.get().inventory == 3
+        assert not InventoryReservation.objects.exists()
+
+    def test_expired_reservations_fail_their_order(self, make_cart, place_order):
+        cart = make_cart(item_count=2, inventory=5, quantity=2)
+        order_id = place_order(cart.id).data['id']
+        InventoryReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        released = inventory.release_expired()
+
+        assert released == 2
+        assert Order.objects.get(pk=order_id).paymentstatus == Order.STATUS_F
+        assert list(Product.objects.values_list('inventory', flat=True)) == [5, 5]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_checkouts_never_oversell_a_hot_product():
+    stock, buyers = 5, 12
+    product = baker.make(Product, unit_price=10, inventory=stock)
+    customer = baker.make(User).customer
+    outcomes = []
+    start = threading.Barrier(buyers)
+
+    def buy():
+        try:
+            start.wait()
+            for attempt in range(50):
+                try:
+                    with transaction.atomic():
+                        order = Order.objects.create(customer=customer)
+                        inventory.reserve(order, {product.id: 1})
+                    outcomes.append('sold')
+                    return
+                except InsufficientInventory:
+                    outcomes.append('refused')
+                    return
+                except OperationalError:
+                    # lock contention (SQLite "table is locked", MySQL deadlock/lock wait): retry
+                    time.sleep(0.01 * (attempt + 1))
+            outcomes.append('gave up')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buy) for _ in range(buyers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes.count('sold') == stock
+    assert outcomes.count('refused') == buyers - stock
+    assert Product.objects.get(pk=product.id).inventory == 0
+    assert InventoryReservation.objects.count() == stock
+
+
+@pytest.mark.django_db
+class TestOrderTotals:
+    def test_totals_are_stored_at_checkout(self, make_cart, place_order):
+        cart = make_cart(item_count=3, quantity=2)
+
+        order = Order.objects.get(pk=place_order(cart.id).data['id'])
+
+        assert order.total_amount == 60
+        assert order.item_count == 3
+
+    def test_totals_follow_item_changes(self):
+        order = baker.make(Order, customer=baker.make(User).customer)
+        item = baker.make(OrderItem, order=order, product=baker.make(Product, unit_price=10), unit_price=10, quantity=2)
+        item.quantity = 5
+        item.save()
+
+        order.refresh_from_db()
+
+        assert order.total_amount == 50
+        assert order.item_count == 1
+
+    def test_saving_an_order_keeps_totals_changed_since_it_was_loaded(self):
+        order = baker.make(Order, customer=baker.make(User).customer)
+        stale = Order.objects.get(pk=order.pk)
+        baker.make(OrderItem, order=order, product=baker.make(Product, unit_price=10), unit_price=10, quantity=2)
+
+        stale.paymentstatus = Order.STATUS_C
+        stale.save()
+
+        order.refresh_from_db()
+        assert (order.paymentstatus, order.total_amount, order.item_count) == (Order.STATUS_C, 20, 1)
+
+    def test_backfill_command_recomputes_historical_orders(self):
+        orders = baker.make(Order, customer=baker.make(User).customer, _quantity=3)
+        for order in orders:
+            baker.make(OrderItem, order=order, product=baker.make(Product, unit_price=10), unit_price=10, quantity=1)
+        Order.objects.update(total_amount=0, item_count=0)
+
+        call_command('backfill_order_totals', chunk_size=2, stdout=StringIO())
+
+        assert list(Order.objects.values_list('total_amount', 'item_count')) == [(10, 1)] * 3
+
+
+@pytest.fixture
+def receiver():
+    calls = []
+    def on_order_created(sender, **kwargs):
+        calls.append(kwargs)
+        if receiver.fail:
+            raise RuntimeError('receiver down')
+    receiver.fail = False
+    receiver.calls = calls
+    order_created.connect(on_order_created)
+    yield receiver
+    order_created.disconnect(on_order_created)
+
+
+@pytest.mark.django_db
+class TestOrderEvents:
+    def test_checkout_records_event_and_dispatches_after_commit(self, make_cart, place_order, receiver, settings, django_capture_on_commit_callbacks):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        with django_capture_on_commit_callbacks() as callbacks:
+            order_id = int(place_order(make_cart(item_count=1).id).data['id'])
+
+        assert receiver.calls == []
+        event = OrderEvent.objects.get()
+        assert (event.order_id, event.kind, event.dispatched_at) == (order_id, OrderEvent.KIND_CREATED, None)
+
+        for callback in callbacks:
+            callback()
+
+        assert receiver.calls == [{'signal': order_created, 'order': order_id, 'event': 'created', 'idempotency_key': f'order:{order_id}:created'}]
+        assert OrderEvent.objects.get().dispatched_at is not None
+
+    def test_checkout_succeeds_when_broker_is_down(self, make_cart, place_order, receiver, monkeypatch, django_capture_on_commit_callbacks):
+        def refuse(*args, **kwargs):
+            raise KombuOperationalError('Error 111 connecting to localhost:6379. Connection refused.')
+        monkeypatch.setattr(tasks.dispatch_order_events, 'delay', refuse)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = place_order(make_cart(item_count=1).id)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert receiver.calls == []
+        # left for the beat schedule
+        assert list(events.pending()) == [OrderEvent.objects.get()]
+
+    def test_dispatch_sends_batches_once(self, receiver):
+        orders = baker.make(Order, customer=baker.make(User).customer, _quantity=5)
+        for order in orders:
+            events.record(order.id, OrderEvent.KIND_CREATED)
+
+        assert events.dispatch(batch_size=3) == (3, 0)
+        assert events.dispatch(batch_size=3) == (2, 0)
+        assert events.dispatch(batch_size=3) == (0, 0)
+        assert [call['order'] for call in receiver.calls] == [order.id for order in orders]
+
+    def test_failed_event_is_retried_with_backoff_until_max_attempts(self, receiver, settings, caplog):
+        settings.STORE_ORDER_EVENT_MAX_ATTEMPTS = 2
+        order = baker.make(Order, customer=baker.make(User).customer)
+        events.record(order.id, OrderEvent.KIND_CREATED)
+        receiver.fail = True
+
+        assert events.dispatch() == (0, 1)
+        # not before its retry is due
+        assert events.dispatch() == (0, 0)
+        retry_at = OrderEvent.objects.get().claimed_until
+        assert events.next_retry_at() == retry_at
+        assert retry_at > timezone.now() + timedelta(seconds=settings.STORE_ORDER_EVENT_RETRY_DELAY - 5)
+
+        OrderEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        assert events.dispatch() == (0, 1)
+        OrderEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        assert events.dispatch() == (0, 0)
+
+        event = OrderEvent.objects.get()
+        assert event.attempts == 2
+        assert 'receiver down' in event.last_error
+        assert event.dispatched_at is None
+        assert [record.levelname for record in caplog.records if record.name == 'store.events'] == ['WARNING', 'ERROR']
+        assert events.next_retry_at() is None
+
+    def test_task_runs_again_when_the_first_retry_is_due(self, receiver, monkeypatch):
+        order = baker.make(Order, customer=baker.make(User).customer)
+        events.record(order.id, OrderEvent.KIND_CREATED)
+        receiver.fail = True
+        retries = []
+        def retry(**kwargs):
+            retries.append(kwargs)
+            return RuntimeError('retry')
+        monkeypatch.setattr(tasks.dispatch_order_events, 'retry', retry)
+
+        with pytest.raises(RuntimeError):
+            tasks.dispatch_order_events()
+
+        assert retries == [{'eta': OrderEvent.objects.get().claimed_until}]
+
+    def test_events_are_claimed_while_receivers_run(self, receiver):
+        orders = baker.make(Order, customer=baker.make(User).customer, _quantity=2)
+        for order in orders:
+            events.record(order.id, OrderEvent.KIND_CREATED)
+        seen_pending = []
+        def on_order_created(sender, **kwargs):
+            seen_pending.append(events.pending().count())
+            if kwargs['order'] == orders[1].id:
+                raise RuntimeError('receiver down')
+        order_created.connect(on_order_created)
+        try:
+            assert events.dispatch() == (1, 1)
+        finally:
+            order_created.disconnect(on_order_created)
+
+        assert seen_pending == [0, 0]
+        first, second = OrderEvent.objects.order_by('id')
+        # the failure of the second event doesn't undo the first one being sent
+        assert first.dispatched_at is not None and first.claimed_until is None
+        assert (second.dispatched_at, second.attempts) == (None, 1)
+        assert second.claimed_until > timezone.now()
+        assert list(events.pending()) == []
+
+    def test_expired_claims_are_taken_again(self, receiver):
+        order = baker.make(Order, customer=baker.make(User).customer)
+        events.record(order.id, OrderEvent.KIND_CREATED)
+        events.claim(batch_size=10)
+        assert events.dispatch() == (0, 0)
+
+        OrderEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+
+        assert events.dispatch() == (1, 0)
+
+
+@pytest.mark.django_db
+class TestOrderExport:
+    def make_order(self, days_ago, item_count):
+        order = baker.make(Order, customer=baker.make(User).customer)
+        for product in baker.make(Product, unit_price=10, _quantity=item_count):
+            baker.make(OrderItem, order=order, product=product, quantity=1, unit_price=10)
+        Order.objects.filter(pk=order.pk).update(placed_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_streams_one_order_per_line_in_date_range(self, api_client, authenticate_user, settings):
+        settings.STORE_EXPORT_CHUNK_SIZE = 1
+        self.make_order(days_ago=40, item_count=1)
+        recent = [self.make_order(days_ago=days, item_count=2) for days in (3, 2)]
+        authenticate_user(is_staff=True)
+        since = (timezone.now() - timedelta(days=30)).isoformat()
+
+        response = api_client.get('/store/orders/export/', {'placed_at__gte': since})
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        assert response['Content-Type'].startswith('application/x-ndjson')
+        assert [order['id'] for order in orders] == [order.id for order in recent]
+        assert [len(order['items']) for order in orders] == [2, 2]
+
+    def test_csv_has_one_row_per_item(self, api_client, authenticate_user):
+        self.make_order(days_ago=1, item_count=3)
+        authenticate_user(is_staff=True)
+
+        response = api_client.get('/store/orders/export/?format=csv')
+
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        assert len(rows) == 3
+        assert rows[0]['item_quantity'] == '1'
+
+    def test_if_user_is_not_admin_returns_403(self, customer_client):
+        response = customer_client.get('/store/orders/export/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,295 @@
+from decimal import Decimal
+from django.db.models import F
+from django.urls import reverse
+from store import bulk, caching
+from store.models import Collection, Product, TaxRate
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def get_products(api_client):
+    def perform_get(query=''):
+        return api_client.get(f'/store/products/{query}')
+    return perform_get
+
+
+@pytest.fixture
+def get_product(api_client):
+    def perform_get(product_id):
+        return api_client.get(f'/store/products/{product_id}/')
+    return perform_get
+
+
+@pytest.mark.django_db
+class TestProductResponseCache:
+    def test_second_retrieve_is_served_without_queries(self, locmem_cache, get_product, django_assert_num_queries):
+        product = baker.make(Product, unit_price=10)
+
+        first = get_product(product.id)
+        with django_assert_num_queries(0):
+            second = get_product(product.id)
+
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT'
+        assert second.data == first.data
+
+    def test_equivalent_queries_share_an_entry(self, locmem_cache, get_products):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=10)
+
+        get_products(f'?collection_id={collection.id}&search=')
+        response = get_products(f'?search=&collection_id={collection.id}')
+
+        assert response['X-Cache'] == 'HIT'
+
+    def test_product_save_invalidates_detail_and_collection_listing(self, locmem_cache, get_product, get_products, django_capture_on_commit_callbacks):
+        product = baker.make(Product, unit_price=10)
+        get_product(product.id)
+        get_products(f'?collection_id={product.collection_id}')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            product.title = 'renamed'
+            product.save()
+        detail = get_product(product.id)
+        listing = get_products(f'?collection_id={product.collection_id}')
+
+        assert detail['X-Cache'] == 'MISS'
+        assert detail.data['title'] == 'renamed'
+        assert listing['X-Cache'] == 'MISS'
+
+    def test_evicted_version_does_not_revive_stale_entries(self, locmem_cache, get_product, django_capture_on_commit_callbacks):
+        product = baker.make(Product, unit_price=10)
+        get_product(product.id)
+        with django_capture_on_commit_callbacks(execute=True):
+            product.title = 'renamed'
+            product.save()
+        get_product(product.id)
+
+        locmem_cache.delete(caching.version_key(caching.SCOPE_PRODUCT, product.id))
+        detail = get_product(product.id)
+
+        assert detail['X-Cache'] == 'MISS'
+        assert detail.data['title'] == 'renamed'
+
+    def test_cache_stats_if_user_is_admin_returns_counters(self, locmem_cache, authenticate_user, api_client, get_product):
+        product = baker.make(Product, unit_price=10)
+        get_product(product.id)
+        get_product(product.id)
+
+        authenticate_user(is_staff=True)
+        response = api_client.get('/store/products/cache-stats/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'hits': 1, 'misses': 1}
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+    def test_walks_every_product_once_without_count(self, get_products):
+        products = baker.make(Product, unit_price=10, _quantity=25)
+
+        seen = []
+        response = get_products('?pagination=keyset')
+        while True:
+            assert 'count' not in response.data
+            seen += [product['id'] for product in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = get_products('?' + response.data['next'].split('?', 1)[1])
+
+        assert seen == sorted(product.id for product in products)
+
+    def test_previous_cursor_returns_previous_page(self, get_products):
+        baker.make(Product, unit_price=10, _quantity=25)
+        first = get_products('?pagination=keyset&ordering=-id')
+        second = get_products('?' + first.data['next'].split('?', 1)[1])
+
+        response = get_products('?' + second.data['previous'].split('?', 1)[1])
+
+        assert response.data['results'] == first.data['results']
+        assert response.data['previous'] is None
+
+    def test_if_cursor_invalid_returns_404(self, get_products):
+        response = get_products('?cursor=garbage')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+    def test_ranks_title_matches_before_description_matches(self, get_products):
+        collection = baker.make(Collection, title='Beverages')
+        in_description = baker.make(Product, title='Bread', description='goes well with coffee', collection=collection, unit_price=10)
+        in_title = baker.make(Product, title='Coffee beans', description='', collection=collection, unit_price=10)
+        baker.make(Product, title='Tea', description='', collection=collection, unit_price=10)
+
+        response = get_products('?search=coffee')
+
+        assert [product['id'] for product in response.data['results']] == [in_title.id, in_description.id]
+
+    def test_every_term_must_match_some_field(self, get_products):
+        collection = baker.make(Collection, title='Beverages')
+        product = baker.make(Product, title='Coffee beans', collection=collection, unit_price=10)
+        baker.make(Product, title='Coffee mug', collection=baker.make(Collection, title='Kitchen'), unit_price=10)
+
+        response = get_products('?search=coff bever')
+
+        assert [product['id'] for product in response.data['results']] == [product.id]
+
+
+@pytest.mark.django_db
+class TestPriceWithTax:
+    def test_if_no_rate_matches_default_rate_applies(self, get_product):
+        product = baker.make(Product, unit_price=10)
+
+        response = get_product(product.id)
+
+        assert response.data['price_with_tax'] == Decimal('10.50')
+
+    def test_collection_rate_overrides_region_rate(self, get_products):
+        collection = baker.make(Collection)
+        product = baker.make(Product, collection=collection, unit_price=10)
+        baker.make(TaxRate, region='eu', collection=None, rate=Decimal('0.2'))
+        baker.make(TaxRate, region='eu', collection=collection, rate=Decimal('0.1'))
+
+        response = get_products(f'?region=eu&collection_id={collection.id}')
+
+        assert response.data['results'][0]['id'] == product.id
+        assert response.data['results'][0]['price_with_tax'] == Decimal('11.00')
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    def test_if_fields_are_selected_only_those_are_returned(self, get_products):
+        baker.make(Product, unit_price=10, description='long text')
+
+        response = get_products('?fields=id,title,unit_price')
+
+        assert set(response.data['results'][0]) == {'id', 'title', 'unit_price'}
+
+    def test_if_images_are_not_selected_they_are_not_prefetched(self, get_products, django_assert_num_queries):
+        baker.make(Product, unit_price=10, _quantity=3)
+
+        # the count and the page
+        with django_assert_num_queries(2) as context:
+            get_products('?fields=id,title')
+
+        assert 'description' not in context.captured_queries[-1]['sql']
+
+    def test_expansions_are_kept_next_to_selected_fields(self, get_products):
+        product = baker.make(Product, unit_price=10)
+
+        response = get_products(f'{product.id}/?fields=id&expand=review_summary')
+
+        assert response.data == {'id': product.id, 'review_summary': {'review_count': 0, 'latest': []}}
+
+    def test_if_unknown_fields_are_selected_returns_400(self, get_products):
+        baker.make(Product, unit_price=10)
+
+        response = get_products('?fields=id,foo,bar')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['fields'] == ['Unknown fields: bar, foo']
+
+
+@pytest.mark.django_db
+class TestCollectionLink:
+    def test_templated_link_matches_reversed_link(self, get_products):
+        collection = baker.make(Collection)
+        baker.make(Product, unit_price=10, collection=collection, _quantity=2)
+
+        response = get_products('?fields=id,collection')
+
+        expected = 'http://testserver' + reverse('store:collection-detail', kwargs={'pk': collection.id})
+        assert [product['collection'] for product in response.data['results']] == [expected, expected]
+
+
+@pytest.mark.django_db
+class TestBulkProducts:
+    def collection_url(self, collection):
+        return 'http://testserver' + reverse('store:collection-detail', kwargs={'pk': collection.id})
+
+    def test_updates_and_creates_in_a_fixed_number_of_queries(self, api_client, authenticate_user, django_assert_max_num_queries):
+        collection, other = baker.make(Collection, _quantity=2)
+        products = baker.make(Product, collection=collection, unit_price=10, inventory=1, _quantity=20)
+        rows = [{'id': product.id, 'unit_price': '12.5', 'inventory': 5} for product in products]
+        rows[0]['collection'] = self.collection_url(other)
+        rows.append({'title': 'New', 'slug': 'new', 'unit_price': 3, 'inventory': 1, 'collection': self.collection_url(other)})
+        authenticate_user(is_staff=True)
+
+        with django_assert_max_num_queries(12):
+            response = api_client.post('/store/products/bulk/', rows, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'created': 1, 'updated': 20}
+        assert set(Product.objects.filter(collection=collection).values_list('unit_price', flat=True)) == {Decimal('12.5')}
+        assert list(Collection.objects.order_by('id').values_list('product_count', flat=True)) == [19, 2]
+
+    def test_if_a_row_is_invalid_nothing_is_written(self, api_client, authenticate_user):
+        product = baker.make(Product, unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post('/store/products/bulk/', [
+            {'id': product.id, 'unit_price': 20},
+            {'id': product.id, 'unit_price': 0},
+            {'id': 0, 'inventory': 1},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error['index'] for error in response.data['errors']] == [1, 2]
+        product.refresh_from_db()
+        assert product.unit_price == 10
+
+    def test_if_a_product_is_repeated_nothing_is_written(self, api_client, authenticate_user):
+        collection, other = baker.make(Collection, _quantity=2)
+        product = baker.make(Product, collection=collection, unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post('/store/products/bulk/', [
+            {'id': product.id, 'collection': self.collection_url(other)},
+            {'id': product.id, 'collection': self.collection_url(other)},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['errors'] == [{'index': 1, 'errors': {'id': ['Product already updated by another row']}}]
+        assert Product.objects.get().collection_id == collection.id
+        assert list(Collection.objects.order_by('id').values_list('product_count', flat=True)) == [1, 0]
+
+    def test_if_id_is_a_boolean_returns_400(self, api_client, authenticate_user):
+        product = baker.make(Product, id=1, unit_price=10)
+        authenticate_user(is_staff=True)
+
+        response = api_client.post('/store/products/bulk/', [{'id': True, 'unit_price': 20}], format='json')
+
+        assert response.data['errors'] == [{'index': 0, 'errors': {'id': ['Product not found']}}]
+        product.refresh_from_db()
+        assert product.unit_price == 10
+
+    def test_rows_write_only_their_own_fields(self):
+        product, other = baker.make(Product, unit_price=10, inventory=1, _quantity=2)
+        changes = bulk.validate([{'id': product.id, 'unit_price': 20}, {'id': other.id, 'inventory': 5}], {})
+        # a restock lands between validation and the write
+        Product.objects.update(inventory=F('inventory') + 3)
+
+        bulk.apply(changes)
+
+        assert list(Product.objects.order_by('id').values_list('unit_price', 'inventory')) == [(20, 4), (10, 5)]
+
+    def test_accepts_ndjson(self, api_client, authenticate_user):
+        products = baker.make(Product, unit_price=10, _quantity=2)
+        authenticate_user(is_staff=True)
+        body = '\n'.join(f'{{"id": {product.id}, "inventory": 7}}' for product in products)
+
+        response = api_client.post('/store/products/bulk/', body, content_type='application/x-ndjson')
+
+        assert response.data == {'created': 0, 'updated': 2}
+        assert set(Product.objects.values_list('inventory', flat=True)) == {7}
+
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate_user):
+        authenticate_user(is_staff=False)
+
+        response = api_client.post('/store/products/bulk/', [], format='json')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
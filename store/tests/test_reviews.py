@@ -0,0 +1,122 @@
+from datetime import timedelta
+from django.utils import timezone
+from store.models import Product, Review, ReviewSummary
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def get_reviews(api_client):
+    def perform_get(product_id):
+        return api_client.get(f'/store/products/{product_id}/reviews/')
+    return perform_get
+
+
+@pytest.mark.django_db
+class TestListReviews:
+    def test_if_product_has_reviews_returns_200_without_checking_product(self, get_reviews, django_assert_num_queries):
+        product = baker.make(Product, unit_price=10)
+        baker.make(Review, product=product, _quantity=2)
+
+        # the page and its count
+        with django_assert_num_queries(2):
+            response = get_reviews(product.id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 2
+
+    def test_reviews_are_paginated_newest_first(self, get_reviews):
+        product = baker.make(Product, unit_price=10)
+        reviews = baker.make(Review, product=product, _quantity=12)
+        for days, review in enumerate(reviews):
+            Review.objects.filter(pk=review.pk).update(date=timezone.now() - timedelta(days=days))
+
+        response = get_reviews(product.id)
+
+        assert response.data['count'] == 12
+        assert [review['id'] for review in response.data['results']] == [review.id for review in reviews[:10]]
+
+    def test_if_product_has_no_reviews_returns_200(self, get_reviews, django_assert_num_queries):
+        product = baker.make(Product, unit_price=10)
+
+        get_reviews(product.id)
+        # the product is remembered after the first lookup
+        with django_assert_num_queries(1):
+            response = get_reviews(product.id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == []
+
+    def test_if_product_does_not_exist_returns_404(self, get_reviews):
+        response = get_reviews(0)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data['detail'] == 'Product not found'
+
+    def test_if_product_is_deleted_returns_404(self, get_reviews):
+        product = baker.make(Product, unit_price=10)
+        get_reviews(product.id)
+
+        product.delete()
+        response = get_reviews(product.id)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestRetrieveReview:
+    def test_if_product_does_not_exist_returns_404(self, api_client):
+        review = baker.make(Review, product=baker.make(Product, unit_price=10))
+
+        response = api_client.get(f'/store/products/0/reviews/{review.id}/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data['detail'] == 'Product not found'
+
+    def test_if_review_exists_returns_200_in_one_query(self, api_client, django_assert_num_queries):
+        review = baker.make(Review, product=baker.make(Product, unit_price=10))
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/store/products/{review.product_id}/reviews/{review.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == review.id
+
+
+@pytest.mark.django_db
+class TestReviewSummary:
+    def test_summary_follows_created_and_deleted_reviews(self, api_client, settings):
+        settings.STORE_REVIEW_SUMMARY_SIZE = 2
+        product = baker.make(Product, unit_price=10)
+        first, second, third = [baker.make(Review, product=product, title=title) for title in 'abc']
+
+        third.delete()
+        response = api_client.get(f'/store/products/{product.id}/reviews/summary/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['review_count'] == 2
+        assert [entry['title'] for entry in response.data['latest']] == ['b', 'a']
+
+    def test_if_product_has_no_reviews_summary_is_empty(self, api_client):
+        product = baker.make(Product, unit_price=10)
+
+        response = api_client.get(f'/store/products/{product.id}/reviews/summary/')
+
+        assert response.data == {'review_count': 0, 'latest': []}
+
+    def test_if_product_does_not_exist_returns_404(self, api_client):
+        response = api_client.get('/store/products/0/reviews/summary/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_product_expands_review_summary_on_request(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        baker.make(Review, product=product, title='a')
+
+        plain = api_client.get(f'/store/products/{product.id}/')
+        expanded = api_client.get(f'/store/products/{product.id}/?expand=review_summary')
+
+        assert 'review_summary' not in plain.data
+        assert expanded.data['review_summary']['review_count'] == 1
+        assert ReviewSummary.objects.get(product=product).review_count == 1
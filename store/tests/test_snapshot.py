@@ -0,0 +1,62 @@
+from decimal import Decimal
+from store import snapshot
+from store.models import Collection, Product, Promotion
+from store.serializers import ProductSerializer
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def snapshot_path(settings, tmp_path):
+    settings.STORE_SNAPSHOT_PATH = str(tmp_path / 'catalog.snap')
+    return settings.STORE_SNAPSHOT_PATH
+
+
+def test_every_product_field_is_exported_or_skipped():
+    exported = set(snapshot.PRODUCT_COLUMNS) | snapshot.SKIPPED_FIELDS
+
+    assert exported == set(ProductSerializer.Meta.fields)
+
+
+@pytest.mark.django_db
+class TestExportSnapshot:
+    def test_snapshot_reads_back_without_copying(self, snapshot_path):
+        collection = baker.make(Collection, title='Shoes')
+        first = baker.make(Product, collection=collection, title='Boot', unit_price=Decimal('12.5'), inventory=3, description=None)
+        second = baker.make(Product, collection=collection, title='Boot', unit_price=10, inventory=0)
+        second.promotions.add(baker.make(Promotion, discount=0.1))
+
+        result = snapshot.export()
+
+        with snapshot.CatalogSnapshot() as catalog:
+            ids = catalog.column('products.id')
+            titles = catalog.column('products.title')
+            prices = catalog.column('products.unit_price')
+            descriptions = catalog.column('products.description')
+            assert len(catalog) == result['products'] == 2
+            assert list(ids) == [first.id, second.id]
+            # the repeated title is stored once
+            assert titles[0] == titles[1] and catalog.string(titles[0]) == 'Boot'
+            assert list(prices) == [1250, 1000]
+            assert catalog.string(descriptions[0]) is None
+            assert catalog.string(catalog.column('collections.title')[0]) == 'Shoes'
+            assert list(catalog.column('product_promotions.product')) == [second.id]
+            for view in (ids, titles, prices, descriptions):
+                view.release()
+
+    def test_endpoint_serves_snapshot_with_etag(self, api_client, snapshot_path):
+        baker.make(Product, unit_price=10)
+        snapshot.export()
+
+        response = api_client.get('/store/products/snapshot/')
+        not_modified = api_client.get('/store/products/snapshot/', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert b''.join(response.streaming_content).startswith(snapshot.MAGIC)
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_if_no_snapshot_returns_404(self, api_client, snapshot_path):
+        response = api_client.get('/store/products/snapshot/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
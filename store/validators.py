@@ -27,5 +27,36 @@ class FileSizeValidator:
                 }
             )
 
+@deconstructible
+class ImagePixelsValidator:
+    """Rejects images too large to decode safely, from the dimensions in their header."""
+    message = _(
+        'Image must have at most %(max_pixels)s pixels'
+    )
+    code = 'invalid_image_pixels'
+
+    def __init__(self, max_pixels, message=None, code=None):
+        self.max_pixels = max_pixels
+        if message is not None:
+            self.message = message
+        if code is not None:
+            self.code = code
+
+    def __call__(self, value):
+        image = getattr(value, 'image', None)
+        if image is None:
+            # stored files are not reopened, they were checked on upload
+            return
+        width, height = image.size
+        if width * height > self.max_pixels:
+            raise ValidationError(
+                self.message,
+                code=self.code,
+                params={
+                    'max_pixels': self.max_pixels,
+                    'value': value,
+                }
+            )
+
 def validate_file_size(file):
     return
\ No newline at end of file
@@ -1,6 +1,9 @@
+import os
+from django.conf import settings
+from django.db import transaction
 from django.db.models.expressions import F
 from django.http.request import QueryDict
-from django.http.response import HttpResponse
+from django.http.response import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.urls.base import resolve, reverse
 from django.utils.datastructures import MultiValueDict
 from django.utils.functional import empty
@@ -12,23 +15,28 @@ from rest_framework import exceptions, mixins, pagination
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.request import override_method
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.generics import GenericAPIView, RetrieveUpdateDestroyAPIView
 
-from store.exceptions import PermissonDeniedException
-from . import decorators
+from store.exceptions import CheckoutError, PermissonDeniedException
+from . import bulk, caching, customers, exports, snapshot, tax
 # from django.core import urlresolvers
 
 from .permissions import IsAdminOrReadOnly
-from .pagination import DefaultPagination
-from .filters import ProductFilter
-from .models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, ProductImage, Review
-from .serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CreateCustomerSerializer, CreateOrderSerializer, CustomerSerializer, OrderItemSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, UpdateCartItemSerializer, UpdateCustomerSerializer, UpdateOrderSerializer
+from .pagination import DefaultPagination, KeysetSelectableMixin
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .carts import get_cart_storage
+from .nested import NestedProductMixin
+from .filters import OrderFilter, ProductFilter, ProductSearchFilter
+from .models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, ProductImage, Review, ReviewSummary
+from .serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CreateCustomerSerializer, CreateOrderSerializer, CustomerSerializer, OrderItemSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, ReviewSummarySerializer, UpdateCartItemSerializer, UpdateCustomerSerializer, UpdateOrderSerializer, get_expanded
 from store import models
 
 from store import serializers
@@ -37,21 +45,41 @@ from store import permissions
 
 
 
-class ProductViewSet(mixins.CreateModelMixin,
+class ProductViewSet(caching.CachedResponseMixin,
+                   KeysetSelectableMixin,
+                   mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.DestroyModelMixin,
                    mixins.ListModelMixin,
                    GenericViewSet):
-    queryset = Product.objects.select_related('collection').prefetch_related('productimage_set').order_by('id')
+    # `collection` is rendered from collection_id, the collection row itself is never needed
+    queryset = Product.objects.prefetch_related('productimage_set').order_by('id')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
     pagination_class = DefaultPagination
     permission_classes = [IsAdminOrReadOnly,]
     search_fields = ['title', 'description', 'collection__title']
     ordering_fields = ['id']
+    cache_prefix = 'products'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = self.prune_queryset(queryset, set(self.get_serializer().fields))
+        return tax.annotate_price_with_tax(queryset, tax.get_region(self.request))
+
+    def prune_queryset(self, queryset, fields):
+        """Load only what the fields left by `?fields=` / `?expand=` will serialize."""
+        if 'productimage_set' not in fields:
+            queryset = queryset.prefetch_related(None)
+        columns = {'id'} | fields & {field.name for field in Product._meta.concrete_fields}
+        if 'review_summary' in fields:
+            queryset = queryset.select_related('review_summary')
+            columns |= {'review_summary__review_count', 'review_summary__latest'}
+        # price_with_tax is annotated in SQL, it needs no loaded column
+        return queryset.only(*columns)
 
     def get_serializer_context(self):
         return {'request':self.request}
@@ -66,9 +94,48 @@ class ProductViewSet(mixins.CreateModelMixin,
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['POST'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create and update products from a JSON array or NDJSON lines: rows with an `id`
+        are partial updates, the others are created. Nothing is written unless every row
+        is valid, otherwise the errors of each invalid row are returned.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise exceptions.ValidationError({'non_field_errors': ['Expected a list of products']})
+        if len(rows) > settings.STORE_BULK_MAX_ROWS:
+            raise exceptions.ValidationError({'non_field_errors': [f'At most {settings.STORE_BULK_MAX_ROWS} products per request']})
+        changes = bulk.validate(rows, self.get_serializer_context())
+        if changes.errors:
+            return Response({'errors': changes.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(bulk.apply(changes))
+
+    @action(detail=False, methods=['GET'])
+    def snapshot(self, request):
+        """The latest catalog snapshot written by export_catalog_snapshot (see store.snapshot)."""
+        try:
+            file = open(snapshot.get_path(), 'rb')
+        except FileNotFoundError:
+            raise exceptions.NotFound('No catalog snapshot yet')
+        stat = os.fstat(file.fileno())
+        # snapshots are replaced, never modified in place, so the inode tells versions apart
+        etag = f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            file.close()
+            return HttpResponseNotModified(headers={'ETag': etag})
+        response = FileResponse(file, content_type='application/octet-stream')
+        response['ETag'] = etag
+        response['Content-Disposition'] = 'attachment; filename="catalog.snap"'
+        return response
+
+    @action(detail=False, methods=['GET'], url_path='cache-stats', permission_classes=[IsAdminUser,])
+    def cache_stats(self, request):
+        return Response(caching.get_stats())
+
 
 class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(product_count=Count('product')).order_by('id')
+    queryset = Collection.objects.order_by('id')
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminOrReadOnly,]
     
@@ -83,27 +150,34 @@ class CollectionViewSet(ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-@method_decorator(decorators.check_product_exist, name='list')
-@method_decorator(decorators.check_product_exist, name='retrieve')
-@method_decorator(decorators.check_product_exist, name='create')
-@method_decorator(decorators.check_product_exist, name='update')
-@method_decorator(decorators.check_product_exist, name='destroy')
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(NestedProductMixin, KeysetSelectableMixin, ModelViewSet):
     serializer_class = ReviewSerializer
     serializer_class_model = serializer_class.Meta.model
     queryset = serializer_class_model.objects.all()
+    pagination_class = DefaultPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['date']
     
     def get_queryset(self):
-        return Review.objects.filter(product=self.kwargs['product_pk'])
+        # newest first, served by the (product, date) index
+        return Review.objects.filter(product=self.product_id).order_by('-date', '-id')
 
     def get_serializer_context(self):
-        return {'product_id':self.kwargs['product_pk']}
+        return {'product_id':self.product_id}
 
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['GET'])
+    def summary(self, request, product_pk=None):
+        summary = ReviewSummary.objects.filter(product_id=self.product_id).first()
+        if summary is None:
+            self.check_product()
+            summary = ReviewSummary(product_id=self.product_id)
+        return Response(ReviewSummarySerializer(summary).data)
+
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(KeysetSelectableMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
     http_method_rel_serializer = {
         'GET': CartItemSerializer,
@@ -117,7 +191,16 @@ class CartItemViewSet(ModelViewSet):
         return super().get_serializer_class()
 
     def get_queryset(self):
-        return super().get_queryset().filter(cart=self.kwargs['cart_pk'])
+        return get_cart_storage().get_items(self.kwargs['cart_pk'])
+
+    def get_object(self):
+        item = get_cart_storage().get_item(self.kwargs['cart_pk'], self.kwargs['pk'])
+        if item is None:
+            raise exceptions.NotFound()
+        return item
+
+    def perform_destroy(self, instance):
+        get_cart_storage().remove_item(instance)
 
     def get_serializer_context(self):
         return {**super().get_serializer_context(), **{'cart_id':self.kwargs['cart_pk']}}
@@ -132,6 +215,18 @@ class CartViewSet(
     queryset = Cart.objects.prefetch_related('cartitem_set__product').order_by('id')
     serializer_class = CartSerializer
 
+    def perform_create(self, serializer):
+        serializer.instance = get_cart_storage().create()
+
+    def get_object(self):
+        cart = get_cart_storage().get(self.kwargs['pk'])
+        if cart is None:
+            raise exceptions.NotFound()
+        return cart
+
+    def perform_destroy(self, instance):
+        get_cart_storage().delete(instance.id)
+
 
 class CustomerViewSet(ModelViewSet):
     http_method_rel_serializer ={
@@ -140,7 +235,8 @@ class CustomerViewSet(ModelViewSet):
         'PUT': UpdateCustomerSerializer,
         'PATCH': UpdateCustomerSerializer,
     }
-    queryset = Customer.objects.all()
+    # the default ordering joins the user anyway, Customer.__str__ reads it
+    queryset = Customer.objects.select_related('user')
     permission_classes = [IsAdminUser,]
     redirect_view_name = ''
     
@@ -155,25 +251,13 @@ class CustomerViewSet(ModelViewSet):
 
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated,])
     def me(self, request):
-        (customer, created) = Customer.objects.select_related('user').get_or_create(user_id=request.user.id)
-        serializer = self.get_serializer_class()(customer)
-        def get():
-            # print(resolve(request.path_info))
-            return
-
-        def put():
-            serializer.initial_data = request.data
+        # request.user comes from the JWT snapshot, reading its id costs no query
+        profile = customers.get_profile(request.user.id)
+        if request.method == 'PUT':
+            serializer = self.get_serializer_class()(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return
-        
-        http_method_to_function_dict = {
-            'GET': get,
-            'PUT': put,
-        }
-
-        http_method_to_function_dict[request.method]()
-        return Response(serializer.data)
+            profile = customers.update_profile(profile, serializer.validated_data)
+        return Response(CustomerSerializer(profile).data)
 
     def permission_denied(self, request, message=None, code=None):
         if request.method == 'GET':
@@ -205,15 +289,17 @@ class OrderItemViewSet(ModelViewSet):
         return {**super().get_serializer_context(), **{'order_id':self.kwargs['order_pk']}}
 
     
-class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.prefetch_related('orderitem_set__product').order_by('id')
+class OrderViewSet(KeysetSelectableMixin, ModelViewSet):
+    queryset = Order.objects.prefetch_related('orderitem_set').order_by('id')
     serializer_class = OrderSerializer
     switch_serializer_class = True
     permission_classes = [IsAdminUser,]
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
 
     def get_permissions(self):
-        if self.request.method not in ['PATCH', 'DELETE']:
+        if self.request.method not in ['PATCH', 'DELETE'] and self.action != 'export':
             return [IsAuthenticated(),]
         return super().get_permissions()
 
@@ -230,52 +316,74 @@ class OrderViewSet(ModelViewSet):
         return super().get_queryset()
 
     def create(self, request, *args, **kwargs):
-        try:
-            customer_id = Customer.objects.get(user_id=self.request.user.id).id
-        except Customer.DoesNotExist:
+        customer_id = Customer.objects.filter(user_id=self.request.user.id).values_list('id', flat=True).order_by('id').first()
+        if customer_id is None:
             # should raise exceptions.ValidationError instead
             return Response({'error':'Customer id not found'}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        cart_id = serializer.validated_data['cart_id']
-
-        if not Cart.objects.filter(pk=cart_id).exists():
-            return Response({'error':'Cart id not found'}, status=status.HTTP_400_BAD_REQUEST)
-        if Cart.objects.filter(pk=cart_id).count() == 0:
-            return Response({'error':'Empty cart'}, status=status.HTTP_400_BAD_REQUEST)
-
-        serializer = OrderSerializer(
-            data=request.data,
-            context={
-                **serializer.context,
-                **{'cart_id': cart_id}
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.validated_data['customer_id'] = customer_id
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        try:
+            order = serializer.save(customer_id=customer_id)
+        except CheckoutError as error:
+            return Response({'error':str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = OrderSerializer(order, context=self.get_serializer_context()).data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
 
-
-@method_decorator(decorators.check_product_exist, name='list')
-@method_decorator(decorators.check_product_exist, name='retrieve')
-@method_decorator(decorators.check_product_exist, name='create')
-@method_decorator(decorators.check_product_exist, name='update')
-@method_decorator(decorators.check_product_exist, name='destroy')
-class ProductImageView(ModelViewSet):
+    @action(detail=False, methods=['GET'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream the orders, filtered by `?placed_at__gte=` / `?placed_at__lt=`, as NDJSON
+        (one order with its items per line) or, with `?format=csv`, as one row per item.
+        """
+        queryset = self.filter_queryset(Order.objects.all())
+        renderer = request.accepted_renderer
+        orders = exports.iter_orders(queryset)
+        if renderer.format == CSVRenderer.format:
+            rows = renderer.render_rows(exports.order_item_rows(orders), exports.ORDER_CSV_FIELDS)
+        else:
+            rows = renderer.render_rows(orders)
+        response = StreamingHttpResponse(rows, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="orders.{renderer.format}"'
+        return response
+
+
+class ProductImageView(NestedProductMixin, ModelViewSet):
     queryset = ProductImage.objects.select_related('product').order_by('id')
     serializer_class = ProductImageSerializer
 
     def get_queryset(self):
-        return super().get_queryset().filter(product=self.kwargs['product_pk'])
+        return super().get_queryset().filter(product=self.product_id)
 
     def get_serializer_context(self):
-        return {**super().get_serializer_context(), **{'product_id':self.kwargs['product_pk']}}
+        return {**super().get_serializer_context(), **{'product_id':self.product_id}}
+
+    def create(self, request, *args, **kwargs):
+        """
+        One file under `image` creates one image and returns it. Files under `images` (any
+        number, one included) are created together or not at all, and returned as a list.
+        """
+        if len(request.FILES.getlist('image')) > 1:
+            raise exceptions.ValidationError({'image': ['Send several files under "images"']})
+        if 'images' not in request.FILES:
+            return super().create(request, *args, **kwargs)
+        files = request.FILES.getlist('images')
+        if len(files) > settings.STORE_IMAGE_UPLOAD_MAX_FILES:
+            raise exceptions.ValidationError({'images': [f'At most {settings.STORE_IMAGE_UPLOAD_MAX_FILES} files per upload']})
+
+        uploads = [self.get_serializer(data={'image': file}) for file in files]
+        errors = {index: upload.errors for index, upload in enumerate(uploads) if not upload.is_valid()}
+        if errors:
+            raise exceptions.ValidationError({'images': errors})
+        with transaction.atomic():
+            for upload in uploads:
+                self.perform_create(upload)
+        return Response([upload.data for upload in uploads], status=status.HTTP_201_CREATED)
 
 
 
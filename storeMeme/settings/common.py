@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+from decimal import Decimal
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -142,7 +143,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING':False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store_core.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -177,12 +178,29 @@ CELERY_BROKER_URL = 'redis://localhost:6379/1'
 CELERY_BEAT_SCHEDULE = {
     'nhan_danh_cong_ly': {
         'task': 'playMeme.tasks.notify_customers',
-        'schedule': 5,
-        'args': ['dit me nhu cac'],
+        'schedule': 24 * 60 * 60,
+        'args': ['emails/email.html'],
         'kwargs': {
-            'meme': 'meme'
+            'context': {'name': 'meme'},
+            'audience': 'buyers',
         }
-    }
+    },
+    'delete_stale_carts': {
+        'task': 'store.tasks.delete_stale_carts',
+        'schedule': 60 * 60,
+    },
+    'release_expired_reservations': {
+        'task': 'store.tasks.release_expired_reservations',
+        'schedule': 60,
+    },
+    'generate_missing_image_variants': {
+        'task': 'store.tasks.generate_missing_image_variants',
+        'schedule': 10 * 60,
+    },
+    'dispatch_order_events': {
+        'task': 'store.tasks.dispatch_order_events',
+        'schedule': 60,
+    },
 }
 
 
@@ -196,6 +214,75 @@ CACHES = {
     }
 }
 
+# Seconds a cached product list/detail response is kept (invalidation is version based)
+STORE_RESPONSE_CACHE_TIMEOUT = 15 * 60
+
+# Region used when a request doesn't pass ?region=, and the rate used when no TaxRate matches
+STORE_TAX_REGION = 'default'
+STORE_DEFAULT_TAX_RATE = Decimal('0.05')
+
+# 'store.carts.RedisCartStorage' keeps carts in the default cache's Redis until checkout
+STORE_CART_STORAGE = 'store.carts.DatabaseCartStorage'
+# Seconds of inactivity after which a Redis cart expires
+STORE_CART_TTL = 7 * 24 * 60 * 60
+# Seconds after which a database cart is considered abandoned, and carts deleted per transaction
+STORE_CART_MAX_AGE = 30 * 24 * 60 * 60
+STORE_CART_GC_BATCH_SIZE = 500
+
+# Seconds a pending order holds its inventory before the order fails, and orders released per transaction
+STORE_RESERVATION_TTL = 30 * 60
+STORE_RESERVATION_BATCH_SIZE = 100
+
+# Size of the in-process memory of existing product ids (see store.nested), and seconds an id is trusted
+STORE_KNOWN_PRODUCTS_SIZE = 10000
+STORE_KNOWN_PRODUCTS_TTL = 60
+
+# Number of most recent reviews kept in a product's review summary
+STORE_REVIEW_SUMMARY_SIZE = 5
+
+# Catalog snapshot written by export_catalog_snapshot and served by /store/products/snapshot/
+STORE_SNAPSHOT_PATH = os.path.join(MEDIA_ROOT, 'snapshots', 'catalog.snap')
+
+# Orders read per query by the streaming order export
+STORE_EXPORT_CHUNK_SIZE = 1000
+
+# Largest request of the bulk product endpoint, and rows per bulk INSERT / UPDATE statement
+STORE_BULK_MAX_ROWS = 10000
+STORE_BULK_CHUNK_SIZE = 500
+
+# Bounding boxes of the WebP variants made of each product image, and their quality
+STORE_IMAGE_VARIANTS = {
+    'thumbnail': (200, 200),
+    'medium': (800, 800),
+}
+STORE_IMAGE_VARIANT_QUALITY = 80
+# Images without variants made per run of store.tasks.generate_missing_image_variants
+STORE_IMAGE_VARIANT_SWEEP_SIZE = 100
+# Files accepted by one upload to /store/products/<id>/images/
+STORE_IMAGE_UPLOAD_MAX_FILES = 20
+
+# Users whose snapshot is kept in process memory by CachedJWTAuthentication, and seconds a
+# snapshot is trusted there; snapshots in Redis are versioned and kept STORE_AUTH_USER_CACHE_TIMEOUT
+STORE_AUTH_USER_LOCAL_SIZE = 10000
+STORE_AUTH_USER_LOCAL_TTL = 30
+STORE_AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a customer profile served by /store/customers/me/ is cached (invalidation is version based)
+STORE_CUSTOMER_PROFILE_TIMEOUT = 60 * 60
+
+# Order events claimed at a time by store.tasks.dispatch_order_events, times an event is
+# tried before it is left for inspection, and seconds before the first retry (doubled after every failure)
+STORE_ORDER_EVENT_BATCH_SIZE = 100
+STORE_ORDER_EVENT_MAX_ATTEMPTS = 10
+STORE_ORDER_EVENT_RETRY_DELAY = 30
+# Seconds a dispatcher has to send the events it claimed before another one may take them
+STORE_ORDER_EVENT_CLAIM_TIMEOUT = 5 * 60
+
+# Mails sent per run of playMeme.tasks.notify_customers over one SMTP connection, and the
+# most mails per second it sends
+PLAYMEME_NOTIFY_BATCH_SIZE = 100
+PLAYMEME_NOTIFY_RATE = 10
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from store import caching
+
+
+VERSION_KEY = 'store_core:user:version:{pk}'
+SNAPSHOT_KEY = 'store_core:user:{pk}:{version}'
+
+# columns of the user every authenticated request may read without loading the row
+SNAPSHOT_FIELDS = ['id', 'username', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active']
+
+# snapshots of recently authenticated users. Saving a user forgets it in this process,
+# other processes may keep it for up to STORE_AUTH_USER_LOCAL_TTL seconds.
+local_users = caching.LocalCache(
+    maxsize=settings.STORE_AUTH_USER_LOCAL_SIZE,
+    ttl=settings.STORE_AUTH_USER_LOCAL_TTL
+)
+
+
+def version_key(pk):
+    return VERSION_KEY.format(pk=pk)
+
+
+def load_snapshot(pk):
+    """Return the snapshot of user `pk`, from process memory, then Redis, then the database."""
+    snapshot = local_users.get(pk)
+    if snapshot is not None:
+        return snapshot
+
+    version = caching.get_versions(version_key(pk))[0]
+    key = SNAPSHOT_KEY.format(pk=pk, version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = get_user_model().objects.filter(pk=pk).values(*SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            return None
+        # a save during the query bumped the version, this key is never read again
+        cache.set(key, snapshot, timeout=settings.STORE_AUTH_USER_CACHE_TIMEOUT)
+    local_users.set(pk, snapshot)
+    return snapshot
+
+
+def forget_user(pk):
+    """Invalidate the cached snapshots of user `pk` (called when the user is saved or deleted)."""
+    local_users.delete(pk)
+    caching.bump_versions(version_key(pk))
+
+
+class CachedUser(SimpleLazyObject):
+    """
+    A user read from its snapshot. The snapshot columns are answered without a query, any
+    other attribute (e.g. `email`, `save()`, `check_password()`) loads the user row once
+    and from then on every access goes to the model instance.
+    """
+    def __init__(self, snapshot):
+        model = get_user_model()
+        super().__init__(lambda: model.objects.get(pk=snapshot['id']))
+        self.__dict__['_snapshot'] = snapshot
+
+    def __getattr__(self, name):
+        if self._wrapped is empty:
+            snapshot = self.__dict__['_snapshot']
+            if name in snapshot:
+                return snapshot[name]
+            if name == 'pk':
+                return snapshot['id']
+            if name in ('is_authenticated', 'is_anonymous'):
+                return name == 'is_authenticated'
+        return super().__getattr__(name)
+
+    # permissions test `request.user and ...`, which must not load the row
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        if self._wrapped is empty:
+            return f'<CachedUser: {self._snapshot["username"]}>'
+        return super().__repr__()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that reads the user from a two tier snapshot cache (see
+    `load_snapshot`) instead of fetching the users row on every request. Snapshots are
+    versioned per user and invalidated by `store_core.signals.handlers` when a user is
+    saved (which includes password changes) or deleted.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        snapshot = load_snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return CachedUser(snapshot)
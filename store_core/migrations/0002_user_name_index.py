@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store_core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'last_name'], name='store_core__first_n_d10b8a_idx'),
+        ),
+    ]
@@ -3,4 +3,11 @@ from django.contrib.auth.models import AbstractUser
 # Create your models here.
 class User(AbstractUser):
     email = models.EmailField(unique=True)
+
+    class Meta(AbstractUser.Meta):
+        # customers are listed by name (see store.Customer.Meta.ordering)
+        indexes = [
+            models.Index(fields=['first_name', 'last_name'])
+        ]
+
     
\ No newline at end of file
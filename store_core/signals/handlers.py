@@ -1,9 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from store.signals import order_created
 from store.models import Customer
+from store_core import authentication
+from store_core.models import User
 from storeMeme import settings
 
 
 @receiver(signal=order_created)
 def on_order_created(sender, **kwargs):
     print(kwargs['order'])
+
+
+# after the commit, so a snapshot read from the old row lands under the old version
+@receiver(signal=post_save, sender=User)
+@receiver(signal=post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    transaction.on_commit(lambda: authentication.forget_user(instance.pk))